@@ -0,0 +1,63 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+
+from core.models import Tag, Ingredient, Recipe
+
+
+def timed(func, repeat=5):
+    """run func repeat times, return (median seconds, last result)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+FLUSH_EVERY = 10000
+
+
+def _insert_rows(model, objs, batch_size):
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def create_library(email, recipes, tags, ingredients, links_per_recipe,
+                   batch_size=None, seed=0):
+    """generate a synthetic library with recipes * links_per_recipe m2m rows
+    on each of the tags and ingredients through tables"""
+    rnd = random.Random(seed)
+    user = get_user_model().objects.create_user(email=email, password='benchmark')
+
+    _insert_rows(Tag, [Tag(user=user, name=f'tag {i}') for i in range(tags)], batch_size)
+    _insert_rows(Ingredient, [Ingredient(user=user, name=f'ingredient {i}') for i in range(ingredients)], batch_size)
+    _insert_rows(Recipe, [
+        Recipe(user=user, title=f'recipe {i}', time_minutes=rnd.randint(5, 180),
+               price=rnd.randint(100, 9999) / 100)
+        for i in range(recipes)
+    ], batch_size)
+
+    # bulk_create only returns primary keys on some backends, so read them back
+    tag_ids = list(Tag.objects.filter(user=user).values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.filter(user=user).values_list('id', flat=True))
+    recipe_ids = list(Recipe.objects.filter(user=user).values_list('id', flat=True))
+
+    tag_links = Recipe.tags.through
+    ingredient_links = Recipe.ingredients.through
+    tag_rows, ingredient_rows = [], []
+    for recipe_id in recipe_ids:
+        for tag_id in rnd.sample(tag_ids, min(links_per_recipe, len(tag_ids))):
+            tag_rows.append(tag_links(recipe_id=recipe_id, tag_id=tag_id))
+        for ingredient_id in rnd.sample(ingredient_ids, min(links_per_recipe, len(ingredient_ids))):
+            ingredient_rows.append(ingredient_links(recipe_id=recipe_id, ingredient_id=ingredient_id))
+        if len(tag_rows) >= FLUSH_EVERY:
+            _insert_rows(tag_links, tag_rows, batch_size)
+            _insert_rows(ingredient_links, ingredient_rows, batch_size)
+            tag_rows, ingredient_rows = [], []
+    _insert_rows(tag_links, tag_rows, batch_size)
+    _insert_rows(ingredient_links, ingredient_rows, batch_size)
+
+    return user
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Lower
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmarks import create_library, timed
+from core.models import Ingredient
+from recipe import autocomplete
+from recipe.views import IngredientViewSet
+
+
+class Command(BaseCommand):
+    """Django command timing ingredient autocomplete against a database
+    prefix query on a generated library, rolled back afterwards"""
+    help = 'benchmark the ingredient autocomplete index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+        view = IngredientViewSet.as_view({'get': 'autocomplete'})
+        repeat = options['repeat']
+
+        with transaction.atomic():
+            user = create_library(
+                'benchmark-autocomplete@example.com',
+                recipes=0,
+                tags=0,
+                ingredients=options['ingredients'],
+                links_per_recipe=0,
+            )
+
+            seconds, _ = timed(lambda: list(
+                Ingredient.objects.filter(user=user, name__istartswith='ingredient 123')
+                .order_by(Lower('name'))[:10].values('id', 'name')
+            ), repeat)
+            self.stdout.write(f'database istartswith   {seconds * 1000:8.3f} ms')
+
+            seconds, index = timed(lambda: autocomplete.PrefixIndex(
+                list(Ingredient.objects.filter(user=user).values_list('id', 'name'))
+            ), 3)
+            self.stdout.write(f'index build            {seconds * 1000:8.3f} ms')
+
+            seconds, _ = timed(lambda: index.search('ingredient 123', 10), repeat)
+            self.stdout.write(f'index lookup           {seconds * 1000:8.3f} ms')
+
+            def call():
+                request = factory.get('/', {'q': 'ingredient 123'})
+                force_authenticate(request, user)
+                return view(request)
+
+            call()
+            seconds, _ = timed(call, repeat)
+            self.stdout.write(f'endpoint, warm index   {seconds * 1000:8.3f} ms')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmarks import create_library, timed
+from core.models import Recipe
+from recipe.cache import bump_data_version
+from recipe.views import RecipeViewSet
+
+
+class Command(BaseCommand):
+    """Django command timing full recipe responses against 304 Not Modified
+    on a generated library, rolled back afterwards"""
+    help = 'benchmark conditional GET on the recipe endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+        list_view = RecipeViewSet.as_view({'get': 'list'})
+        detail_view = RecipeViewSet.as_view({'get': 'retrieve'})
+
+        with transaction.atomic():
+            user = create_library(
+                'benchmark-conditional@example.com',
+                recipes=options['recipes'],
+                tags=50,
+                ingredients=200,
+                links_per_recipe=5,
+            )
+            recipe_id = Recipe.objects.filter(user=user).values_list('id', flat=True).first()
+            params = {'page_size': options['page_size']}
+
+            def call(view, headers=None, uncached=False, **kwargs):
+                if uncached:
+                    bump_data_version(user.pk)
+                request = factory.get('/', params, **(headers or {}))
+                force_authenticate(request, user)
+                response = view(request, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+                return response
+
+            def report(label, case, func):
+                seconds, response = timed(func, options['repeat'])
+                self.stdout.write(
+                    f'{label:<7} {case:<15} {response.status_code} '
+                    f'{seconds * 1000:8.2f} ms {len(response.content):9d} bytes'
+                )
+
+            for label, view, kwargs in (('list', list_view, {}),
+                                        ('detail', detail_view, {'pk': recipe_id})):
+                report(label, 'full, uncached', lambda: call(view, uncached=True, **kwargs))
+                report(label, 'full, cached', lambda: call(view, **kwargs))
+                headers = {'HTTP_IF_NONE_MATCH': call(view, **kwargs)['ETag']}
+                report(label, '304', lambda: call(view, headers, **kwargs))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,61 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmarks import create_library, timed
+from core.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    """Django command comparing the m2m JOIN filter with the semi-join filter
+    on a generated library, rolled back afterwards"""
+    help = 'benchmark recipe tag filtering: JOIN vs semi-join'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=200000)
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument('--links-per-recipe', type=int, default=5)
+        parser.add_argument('--filter-tags', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('generating library ...')
+            user = create_library(
+                'benchmark-filters@example.com',
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['tags'],
+                links_per_recipe=options['links_per_recipe'],
+            )
+            links = Recipe.tags.through.objects.filter(recipe__user=user).count()
+            self.stdout.write(f'{options["recipes"]} recipes, {links} recipe-tag links')
+
+            tag_ids = list(Tag.objects.filter(user=user).values_list('id', flat=True))
+            ids = random.Random(1).sample(tag_ids, options['filter_tags'])
+            recipes = Recipe.objects.filter(user=user)
+
+            def join_any():
+                return len(list(recipes.filter(tags__id__in=ids).values_list('id', flat=True)))
+
+            def semi_join_any():
+                return len(list(recipes.having_related('tags', ids).values_list('id', flat=True)))
+
+            def join_all():
+                queryset = recipes
+                for tag_id in ids:
+                    queryset = queryset.filter(tags__id=tag_id)
+                return len(list(queryset.values_list('id', flat=True)))
+
+            def semi_join_all():
+                return len(list(recipes.having_related('tags', ids, match_all=True).values_list('id', flat=True)))
+
+            for label, func in (('any / join', join_any),
+                                ('any / semi-join', semi_join_any),
+                                ('all / chained join', join_all),
+                                ('all / semi-join', semi_join_all)):
+                seconds, rows = timed(func, options['repeat'])
+                self.stdout.write(f'{label:<20} {seconds * 1000:10.1f} ms {rows:10d} rows')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from core.benchmarks import create_library, timed
+from core.models import Ingredient, Recipe
+from recipe import matching
+
+
+class Command(BaseCommand):
+    """Django command timing pantry matching with ORM aggregation against
+    the in-memory sparse matrix on a generated library, rolled back afterwards"""
+    help = 'benchmark "what can I cook" recipe matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--links-per-recipe', type=int, default=8)
+        parser.add_argument('--pantry', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = create_library(
+                'benchmark-match@example.com',
+                recipes=options['recipes'],
+                tags=0,
+                ingredients=options['ingredients'],
+                links_per_recipe=options['links_per_recipe'],
+            )
+            pantry = list(
+                Ingredient.objects.filter(user=user).order_by('id').values_list('id', flat=True)[:options['pantry']]
+            )
+
+            def orm():
+                return list(
+                    Recipe.objects.filter(user=user).annotate(
+                        matched=Count('ingredients', filter=Q(ingredients__in=pantry)),
+                        total=Count('ingredients'),
+                    ).filter(matched__gt=0).annotate(
+                        missing=F('total') - F('matched')
+                    ).order_by('missing', '-matched', 'id').values_list('id', 'matched', 'missing')[:20]
+                )
+
+            seconds, expected = timed(orm, options['repeat'])
+            self.stdout.write(f'orm aggregate      {seconds * 1000:9.2f} ms')
+
+            seconds, matrix = timed(lambda: matching.build_matrix(user.pk), 1)
+            self.stdout.write(f'matrix build       {seconds * 1000:9.2f} ms')
+
+            seconds, ranked = timed(lambda: matrix.match(frozenset(pantry), 20), options['repeat'])
+            self.stdout.write(f'matrix match       {seconds * 1000:9.2f} ms')
+
+            matrix.replace_rows({pk: set(pantry[:3]) for pk, _, _ in ranked[:10]})
+            seconds, _ = timed(lambda: matrix.match(frozenset(pantry), 20), options['repeat'])
+            self.stdout.write(f'  with overrides   {seconds * 1000:9.2f} ms')
+
+            if [tuple(row) for row in expected] != ranked:
+                self.stderr.write('matrix ranking differs from the orm ranking')
+            transaction.set_rollback(True)
@@ -0,0 +1,81 @@
+import time
+from collections import Counter
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmarks import create_library, timed
+from core.models import Recipe
+from recipe import similarity
+
+
+class Command(BaseCommand):
+    """Django command timing similar recipe lookups through the MinHash/LSH
+    index against an exact scan of the through tables on a generated
+    library, rolled back afterwards"""
+    help = 'benchmark the similar recipes index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--links-per-recipe', type=int, default=5)
+        parser.add_argument('--near-duplicates', type=int, default=20,
+                            help='recipes copying the probe recipe with one ingredient changed')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def exact(self, recipe_id):
+        """Jaccard similarity of recipe_id against every recipe of its user"""
+        probe = similarity.feature_sets([recipe_id])[recipe_id]
+        shared = Counter()
+        for field_name, offset in (('tags', 0), ('ingredients', 1)):
+            field = Recipe._meta.get_field(field_name)
+            target = f'{field.m2m_reverse_field_name()}_id'
+            ids = [f // 2 for f in probe if f % 2 == offset]
+            links = field.remote_field.through.objects.filter(**{f'{target}__in': ids})
+            shared.update(links.values_list('recipe_id', flat=True))
+        shared.pop(recipe_id, None)
+        sizes = similarity.feature_sets(list(shared))
+        scores = {pk: n / (len(probe) + len(sizes[pk]) - n) for pk, n in shared.items()}
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            user = create_library(
+                'benchmark-similar@example.com',
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                links_per_recipe=options['links_per_recipe'],
+            )
+            probe = Recipe.objects.filter(user=user).order_by('id').first()
+            probe_ingredients = list(probe.ingredients.values_list('id', flat=True))
+            spare = Recipe.ingredients.field.related_model.objects.filter(user=user).exclude(
+                id__in=probe_ingredients).values_list('id', flat=True).first()
+            for i in range(options['near_duplicates']):
+                copy = Recipe.objects.create(user=user, title=f'near duplicate {i}', time_minutes=10, price=1)
+                copy.tags.set(probe.tags.all())
+                copy.ingredients.set(probe_ingredients[:-1] + [spare])
+            self.stdout.write(f'library generated in {time.perf_counter() - start:.1f}s')
+
+            seconds, _ = timed(lambda: call_command('rebuild_similarity_index', stdout=StringIO()), 1)
+            self.stdout.write(f'index rebuild          {seconds:9.2f} s')
+
+            seconds, exact = timed(lambda: self.exact(probe.pk), options['repeat'])
+            self.stdout.write(f'exact scan             {seconds * 1000:9.2f} ms')
+
+            probe = Recipe.objects.select_related('signature').get(pk=probe.pk)
+            seconds, approx = timed(lambda: similarity.similar_recipes(probe, 10), options['repeat'])
+            self.stdout.write(f'minhash/lsh lookup     {seconds * 1000:9.2f} ms')
+
+            wanted = {pk for pk, score in exact if score >= 0.5}
+            found = wanted & {pk for pk, _ in approx}
+            self.stdout.write(f'recall of the {len(wanted)} exact top-10 matches >= 0.5: {len(found)}')
+
+            other = Recipe.objects.filter(user=user).order_by('-id')[100]
+            seconds, _ = timed(lambda: other.ingredients.add(spare), 1)
+            self.stdout.write(f'incremental m2m update {seconds * 1000:9.2f} ms')
+            transaction.set_rollback(True)
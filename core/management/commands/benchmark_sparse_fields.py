@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmarks import create_library, timed
+from recipe.cache import bump_data_version
+from recipe.views import RecipeViewSet
+
+CASES = (
+    ('default', {}),
+    ('titles only', {'fields': 'id,title'}),
+    ('no relations', {'fields': 'id,title,price,time_minutes,link,image'}),
+    ('expand tags', {'expand': 'tags'}),
+    ('expand both', {'expand': 'tags,ingredients'}),
+    ('titles, tags', {'fields': 'id,title', 'expand': 'tags'}),
+)
+
+
+class Command(BaseCommand):
+    """Django command comparing response size, query count and time of a
+    recipe list page across ?fields= and ?expand= on a generated library,
+    rolled back afterwards"""
+    help = 'benchmark sparse fieldsets and expansion on the recipe list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+        list_view = RecipeViewSet.as_view({'get': 'list'})
+
+        with transaction.atomic():
+            user = create_library(
+                'benchmark-sparse@example.com',
+                recipes=options['recipes'],
+                tags=50,
+                ingredients=200,
+                links_per_recipe=5,
+            )
+
+            def call(params):
+                # a fresh data version each time, so no response comes from the cache
+                bump_data_version(user.pk)
+                request = factory.get('/', {'page_size': options['page_size'], **params})
+                force_authenticate(request, user)
+                response = list_view(request)
+                response.render()
+                return response
+
+            for case, params in CASES:
+                with CaptureQueriesContext(connection) as queries:
+                    call(params)
+                seconds, response = timed(lambda: call(params), options['repeat'])
+                self.stdout.write(
+                    f'{case:<13} {response.status_code} {len(queries):2d} queries '
+                    f'{seconds * 1000:8.2f} ms {len(response.content):9d} bytes'
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.models import ChangeLogEntry, ChangeLogWriter
+
+
+class Command(BaseCommand):
+    """Django command bounding the change log: drops entries superseded by a
+    newer entry for the same object and everything older than the retention"""
+    help = 'compact the delta sync change log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.CHANGE_LOG_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def delete_in_batches(self, queryset, batch_size):
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return deleted
+                deleted += ChangeLogEntry.objects.filter(id__in=ids).delete()[0]
+
+    def handle(self, *args, **options):
+        # cursors older than the retention are refused by the feed, so
+        # nothing before it can be read any more
+        horizon = timezone.now() - timedelta(days=options['retention_days'])
+        expired = self.delete_in_batches(
+            ChangeLogEntry.objects.filter(created_at__lt=horizon), options['batch_size']
+        )
+
+        # a client behind an entry also reads the newer one for that object
+        newer = ChangeLogEntry.objects.filter(
+            user_id=OuterRef('user_id'),
+            model=OuterRef('model'),
+            object_id=OuterRef('object_id'),
+            id__gt=OuterRef('id')
+        )
+        superseded = self.delete_in_batches(
+            ChangeLogEntry.objects.annotate(superseded=Exists(newer)).filter(superseded=True),
+            options['batch_size']
+        )
+
+        # writer locks of deleted users are never taken again
+        ChangeLogWriter.objects.annotate(
+            live=Exists(get_user_model().objects.filter(pk=OuterRef('user_id')))
+        ).filter(live=False).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'removed {expired} expired and {superseded} superseded change log entries'
+        ))
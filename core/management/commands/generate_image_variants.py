@@ -0,0 +1,23 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command creating missing responsive variants of recipe images"""
+    help = 'backfill responsive variants for existing recipe images'
+
+    def handle(self, *args, **options):
+        created = 0
+        names = Recipe.objects.exclude(image='').values_list('image', flat=True)
+        for name in names.iterator():
+            missing = [
+                (width, fmt)
+                for fmt in images.variant_formats() for width in images.variant_widths()
+                if not default_storage.exists(images.variant_name(name, width, fmt))
+            ]
+            if missing:
+                created += len(images.generate_variants(name, only=missing))
+        self.stdout.write(self.style.SUCCESS(f'created {created} image variants'))
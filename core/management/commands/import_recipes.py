@@ -0,0 +1,97 @@
+import hashlib
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import RecipeImport
+from recipe import importer
+
+EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    """Django command importing recipes with their tag and ingredient names
+    from an NDJSON or CSV file (the format of recipes/export/) for a user.
+
+    Every chunk is committed together with the import's progress, so
+    running the same command again after a crash continues after the last
+    committed row.
+    """
+    help = 'import recipes from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='email of the owner of the imported recipes')
+        parser.add_argument('--format', choices=sorted(importer.READERS),
+                            help='default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows committed per transaction')
+        parser.add_argument('--restart', action='store_true',
+                            help='import from the first row again, even a file imported before')
+
+    def handle(self, *args, **options):
+        path, chunk_size = options['path'], options['chunk_size']
+        fmt = options['format'] or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise CommandError('cannot tell the format from the file name, pass --format')
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'no user {options["user"]}')
+
+        progress, _ = RecipeImport.objects.get_or_create(user=user, source_sha256=file_sha256(path))
+        if options['restart']:
+            progress.rows_done = progress.recipes_created = progress.rows_rejected = 0
+            progress.finished_at = None
+            progress.save()
+        elif progress.finished_at is not None:
+            self.stdout.write(f'{path} was imported for {user.email} on {progress.finished_at:%Y-%m-%d %H:%M}, '
+                              'pass --restart to import it again')
+            return
+        elif progress.rows_done:
+            self.stdout.write(f'resuming after row {progress.rows_done}')
+
+        start, imported = time.perf_counter(), 0
+        known = {}
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = islice(enumerate(importer.READERS[fmt](file), start=1), progress.rows_done, None)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    created, rejected = importer.import_chunk(user, chunk, known)
+                    progress.rows_done += len(chunk)
+                    progress.recipes_created += created
+                    progress.rows_rejected += len(rejected)
+                    progress.save()
+                for number, error in rejected:
+                    self.stderr.write(f'row {number}: {error}')
+                imported += len(chunk)
+                self.stdout.write(
+                    f'{progress.rows_done} rows, {progress.recipes_created} recipes, '
+                    f'{progress.rows_rejected} rejected, '
+                    f'{imported / max(time.perf_counter() - start, 1e-9):.0f} rows/s'
+                )
+
+        progress.finished_at = timezone.now()
+        progress.save()
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'imported {progress.recipes_created} recipes from {progress.rows_done} rows '
+            f'({progress.rows_rejected} rejected) in {seconds:.1f}s ({imported / max(seconds, 1e-9):.0f} rows/s)'
+        ))
@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipe import images, uploads
+
+
+class Command(BaseCommand):
+    """Django command running the recipe image worker over the job table"""
+    help = 'process staged recipe image uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--upload-expiry-hours', type=int, default=24,
+                            help='drop resumable uploads left unfinished this long')
+
+    def work(self, once, poll_interval):
+        processed = 0
+        while True:
+            job = images.claim_job()
+            if job is None:
+                if once:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            try:
+                status = images.process_job(job)
+            except Exception as exc:
+                # keep the worker alive; the job is reported as failed
+                images.finish_job(job, job.FAILED, f'{type(exc).__name__}: {exc}')
+                status = job.status
+            processed += 1
+            self.stdout.write(f'image job {job.pk}: {status}')
+
+    def work_in_thread(self, once, poll_interval):
+        try:
+            return self.work(once, poll_interval)
+        finally:
+            # each thread opened its own connection
+            connection.close()
+
+    def handle(self, *args, **options):
+        requeued = images.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'requeued {requeued} stale image jobs')
+        expired = uploads.expire_uploads(timedelta(hours=options['upload_expiry_hours']))
+        if expired:
+            self.stdout.write(f'expired {expired} unfinished uploads')
+
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            processed = self.work(options['once'], options['poll_interval'])
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(self.work_in_thread, options['once'], options['poll_interval'])
+                           for _ in range(workers)]
+                processed = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f'processed {processed} image jobs'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Recipe
+from recipe import similarity
+
+
+class Command(BaseCommand):
+    """Django command recomputing every recipe's MinHash signature and LSH
+    buckets, e.g. after a bulk import or a change of the index parameters"""
+    help = 'rebuild the similar recipes index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        indexed, last_id = 0, 0
+        while True:
+            # each batch replaces its own entries in one transaction, so the
+            # rest of the index keeps answering while the rebuild runs
+            with transaction.atomic():
+                batch = list(
+                    Recipe.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                indexed += similarity.update_recipes(batch)
+            last_id = batch[-1]
+            self.stdout.write(f'indexed {indexed} recipes up to id {last_id}')
+
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'indexed {indexed} recipes in {seconds:.1f}s ({indexed / max(seconds, 1e-9):.0f}/s)'
+        ))
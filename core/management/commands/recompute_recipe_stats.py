@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import stats
+
+
+class Command(BaseCommand):
+    """Django command recomputing the per-user recipe stats rollups from the
+    recipes, reporting every rollup the incremental updates let drift"""
+    help = 'recompute the recipe stats rollups and check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='only report drifted rollups, failing if there are any')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        checked, drifted, last_id = 0, [], 0
+        while True:
+            batch = list(users.filter(pk__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            found = stats.drifted(batch)
+            drifted.extend(found)
+            if found:
+                self.stdout.write(f'drifted: users {", ".join(map(str, found))}')
+            if not options['check']:
+                stats.rebuild(batch)
+            checked += len(batch)
+            last_id = batch[-1]
+
+        if options['check'] and drifted:
+            raise CommandError(f'{len(drifted)} of {checked} users have drifted recipe stats')
+        action = 'checked' if options['check'] else 'recomputed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} recipe stats of {checked} users, {len(drifted)} had drifted'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    """Django command recounting the denormalized recipe_count of tags and
+    ingredients from their recipe links and fixing the ones that drifted"""
+    help = 'reconcile the recipe_count of tags and ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='only report drifted counters, failing if there are any')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Tag, Ingredient):
+            drifted, last_id = 0, 0
+            while True:
+                with transaction.atomic():
+                    ids = list(
+                        model.objects.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', flat=True)[:options['batch_size']]
+                    )
+                    if not ids:
+                        break
+                    batch = model.objects.filter(id__in=ids)
+                    if options['check']:
+                        drifted += batch.drifted_recipe_counts().count()
+                    else:
+                        drifted += batch.reconcile_recipe_counts()
+                last_id = ids[-1]
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {drifted} drifted')
+            total += drifted
+
+        if options['check'] and total:
+            raise CommandError(f'{total} recipe counters have drifted')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"checked" if options["check"] else "reconciled"} recipe counters, {total} had drifted'
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('staged_file', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='core.Recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipeimagejob',
+            index=models.Index(fields=['status', 'id'], name='core_recipe_status_587522_idx'),
+        ),
+    ]
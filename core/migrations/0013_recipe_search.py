@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:15
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+def backfill_search_text(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    last_id = 0
+    while True:
+        # keyset batches: iterator() would drop the prefetch
+        batch = list(
+            Recipe.objects.filter(id__gt=last_id).order_by('id')
+            .prefetch_related('tags', 'ingredients').only('id')[:2000]
+        )
+        if not batch:
+            break
+        for recipe in batch:
+            names = [tag.name for tag in recipe.tags.all()] + [item.name for item in recipe.ingredients.all()]
+            recipe.search_text = ' '.join(names)
+        Recipe.objects.bulk_update(batch, ['search_text'])
+        last_id = batch[-1].id
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE core_recipe SET search_vector = "
+            "setweight(to_tsvector('english', title), 'A') || "
+            "setweight(to_tsvector('english', search_text), 'B')"
+        )
+        schema_editor.execute(
+            'CREATE INDEX core_recipe_search_vector_gin ON core_recipe USING gin (search_vector)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipeimageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN exists on Postgres only; elsewhere search uses recipe.search's
+        # in-process inverted index
+        migrations.RunPython(backfill_search_text, drop_search_index),
+    ]
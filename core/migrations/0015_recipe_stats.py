@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('price_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('price_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('time_minutes_total', models.BigIntegerField(default=0)),
+                ('time_minutes_min', models.IntegerField(null=True)),
+                ('time_minutes_max', models.IntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeAttrUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipeattrusage',
+            index=models.Index(fields=['user', 'model'], name='core_recipe_user_id_39f1b6_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipeattrusage',
+            unique_together={('model', 'object_id')},
+        ),
+    ]
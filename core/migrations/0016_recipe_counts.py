@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:34
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_recipe_counts(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    for field_name, model_name in (('tags', 'Tag'), ('ingredients', 'Ingredient')):
+        field = Recipe._meta.get_field(field_name)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        counts = field.remote_field.through.objects.filter(
+            **{target: models.OuterRef('pk')}
+        ).order_by().values(target).annotate(count=models.Count('id')).values('count')
+        apps.get_model('core', model_name).objects.update(recipe_count=Coalesce(
+            models.Subquery(counts, output_field=models.IntegerField()), 0
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_recipe_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='core_ingred_user_id_095066_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='core_tag_user_id_a50c7e_idx'),
+        ),
+        # the usage counts now live in the recipe_count columns
+        migrations.DeleteModel(
+            name='RecipeAttrUsage',
+        ),
+    ]
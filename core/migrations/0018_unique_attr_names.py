@@ -0,0 +1,90 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Lower
+
+BATCH_SIZE = 500
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """fold every tag/ingredient into the oldest one of the same user with
+    the same name ignoring case; recipe links move to the survivor (once
+    per recipe) and sync clients are told about the deleted rows"""
+    Recipe = apps.get_model('core', 'Recipe')
+    ChangeLogEntry = apps.get_model('core', 'ChangeLogEntry')
+    for field_name, model_name in (('tags', 'Tag'), ('ingredients', 'Ingredient')):
+        model = apps.get_model('core', model_name)
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+
+        # LOWER() of the database, the same function the unique index uses
+        keepers, merged, user_ids = {}, {}, {}
+        rows = model.objects.annotate(key=Lower('name')).order_by('id').values_list('id', 'user_id', 'key')
+        for pk, user_id, key in rows.iterator():
+            keeper = keepers.setdefault((user_id, key), pk)
+            if keeper != pk:
+                merged[pk] = keeper
+                user_ids[pk] = user_id
+
+        merged_ids = sorted(merged)
+        touched_recipes = {}
+        for start in range(0, len(merged_ids), BATCH_SIZE):
+            batch = merged_ids[start:start + BATCH_SIZE]
+            links = list(through.objects.filter(**{f'{target}__in': batch}).values_list('id', 'recipe_id', target))
+            recipe_ids = {recipe_id for _, recipe_id, _ in links}
+            linked = set(through.objects.filter(
+                recipe_id__in=recipe_ids, **{f'{target}__in': {merged[pk] for pk in batch}}
+            ).values_list('recipe_id', target))
+
+            moves, dropped = {}, []
+            for link_id, recipe_id, pk in links:
+                pair = (recipe_id, merged[pk])
+                if pair in linked:
+                    dropped.append(link_id)
+                else:
+                    linked.add(pair)
+                    moves.setdefault(merged[pk], []).append(link_id)
+                touched_recipes[recipe_id] = user_ids[pk]
+            through.objects.filter(id__in=dropped).delete()
+            for keeper, link_ids in moves.items():
+                through.objects.filter(id__in=link_ids).update(**{target: keeper})
+
+            model.objects.filter(id__in=batch).delete()
+            ChangeLogEntry.objects.bulk_create([
+                ChangeLogEntry(user_id=user_ids[pk], model=model._meta.model_name, object_id=pk, action='delete')
+                for pk in batch
+            ])
+
+        ChangeLogEntry.objects.bulk_create([
+            ChangeLogEntry(user_id=user_id, model='recipe', object_id=recipe_id, action='upsert')
+            for recipe_id, user_id in touched_recipes.items()
+        ], batch_size=BATCH_SIZE)
+
+        survivors = sorted(set(merged.values()))
+        counts = through.objects.filter(
+            **{target: models.OuterRef('pk')}
+        ).order_by().values(target).annotate(count=models.Count('id')).values('count')
+        for start in range(0, len(survivors), BATCH_SIZE):
+            model.objects.filter(id__in=survivors[start:start + BATCH_SIZE]).update(recipe_count=Coalesce(
+                models.Subquery(counts, output_field=models.IntegerField()), 0
+            ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipeimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        # expression indexes cannot be declared on the models before Django
+        # 3.2, both Postgres and SQLite take this one as written
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_tag_user_lower_name_uniq ON core_tag (user_id, LOWER(name))',
+            'DROP INDEX core_tag_user_lower_name_uniq',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_ingredient_user_lower_name_uniq ON core_ingredient (user_id, LOWER(name))',
+            'DROP INDEX core_ingredient_user_lower_name_uniq',
+        ),
+    ]
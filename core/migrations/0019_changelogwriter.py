@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_unique_attr_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogWriter',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
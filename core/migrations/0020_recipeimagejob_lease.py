@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_changelogwriter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimagejob',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='recipeimagejob',
+            name='locked_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_recipeimagejob_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimageupload',
+            name='chunk_claim',
+            field=models.UUIDField(null=True),
+        ),
+        migrations.AddField(
+            model_name='recipeimageupload',
+            name='chunk_claimed_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -1,9 +1,14 @@
 import uuid
 import os
 
-from django.db import models
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
 from django.contrib.auth.models import PermissionsMixin, BaseUserManager, AbstractBaseUser
 from django.conf import settings
+from django.utils import timezone
 
 
 def recipe_image_file_path(instance, filename: str):
@@ -48,22 +53,110 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
-class Tag(models.Model):
+class RecipeAttrQuerySet(models.QuerySet):
+    def assigned(self):
+        """keep rows used by at least one recipe, probed with a correlated EXISTS"""
+        field = self.model._meta.get_field('recipe').field
+        links = field.remote_field.through.objects.filter(
+            **{f'{field.m2m_reverse_field_name()}_id': models.OuterRef('pk')}
+        )
+        return self.annotate(assigned=models.Exists(links)).filter(assigned=True)
+
+    def with_actual_recipe_count(self):
+        """annotate actual_recipe_count, counted over the links themselves"""
+        field = self.model._meta.get_field('recipe').field
+        target = f'{field.m2m_reverse_field_name()}_id'
+        counts = field.remote_field.through.objects.filter(
+            **{target: models.OuterRef('pk')}
+        ).order_by().values(target).annotate(count=models.Count('id')).values('count')
+        return self.annotate(actual_recipe_count=Coalesce(
+            models.Subquery(counts, output_field=models.IntegerField()), 0
+        ))
+
+    def drifted_recipe_counts(self):
+        return self.with_actual_recipe_count().exclude(recipe_count=models.F('actual_recipe_count'))
+
+    def reconcile_recipe_counts(self):
+        """rewrite the recipe_count of rows whose counter drifted, returns
+        how many were off"""
+        fixed = [
+            self.model(pk=pk, recipe_count=count)
+            for pk, count in self.drifted_recipe_counts().values_list('pk', 'actual_recipe_count')
+        ]
+        self.model.objects.bulk_update(fixed, ['recipe_count'], batch_size=500)
+        return len(fixed)
+
+
+class RecipeCounterMixin:
+    """recipe_count is only moved by F() updates (adjust_recipe_counts);
+    saving an instance loaded earlier must not write its stale copy back"""
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'recipe_count'
+            ]
+        super().save(*args, **kwargs)
+
+
+class Tag(RecipeCounterMixin, models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # number of linked recipes, denormalized for ?ordering=-usage
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        # (user, LOWER(name)) is unique too, an expression index created
+        # by migration 0018
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', '-recipe_count', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(RecipeCounterMixin, models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # number of linked recipes, denormalized for ?ordering=-usage
+    recipe_count = models.IntegerField(default=0, editable=False)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        # (user, LOWER(name)) is unique too, an expression index created
+        # by migration 0018
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', '-recipe_count', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def having_related(self, field_name, ids, match_all=False):
+        """keep recipes linked to any (or every) of ids through the m2m field_name"""
+        field = self.model._meta.get_field(field_name)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects.filter(**{f'{target}__in': ids})
+        if match_all:
+            links = links.values(source).annotate(
+                matched=models.Count(target)
+            ).filter(matched=len(set(ids)))
+        # semi-join: IN (subquery) never multiplies recipe rows like a JOIN does
+        return self.filter(id__in=links.values(source))
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
@@ -71,9 +164,498 @@ class Recipe(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    updated_at = models.DateTimeField(auto_now=True)
+    # tag and ingredient names, kept in sync for full-text search; Postgres
+    # also keeps the weighted tsvector of title + names (GIN indexed)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
 
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        # composite keys backing the keyset pagination orderings
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'title', 'id']),
+            models.Index(fields=['user', 'time_minutes', 'id']),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class RecipeImageJob(models.Model):
+    """an uploaded image waiting in the staging area for the image worker"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'pending'),
+        (PROCESSING, 'processing'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='image_jobs')
+    staged_file = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=255, blank=True)
+    # the worker processing the job and until when it holds it; renewed as
+    # it goes, an expired lease means the worker died
+    locked_by = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+
+class RecipeImageUpload(models.Model):
+    """a resumable image upload receiving its bytes in chunks; on completion
+    the staged file is handed to the image worker as a RecipeImageJob"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='image_uploads')
+    staged_file = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    offset = models.PositiveIntegerField(default=0)
+    # the request writing the chunk at offset and until when it may
+    chunk_claim = models.UUIDField(null=True)
+    chunk_claimed_until = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ImageBlob(models.Model):
+    """reference count of a content addressed image file shared by recipes;
+    a row at zero is waiting for its file to be collected"""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of a recipe's tag and ingredient set"""
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField()
+
+
+class RecipeSimilarityBucket(models.Model):
+    """LSH band of a recipe signature; recipes sharing a (band, bucket)
+    of the same user are the candidates for similar recipes"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similarity_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        # covers the candidate lookup: user + bucket value in, recipe out
+        indexes = [
+            models.Index(fields=['user', 'bucket', 'band', 'recipe']),
+        ]
+
+
+class RecipeStats(models.Model):
+    """per-user rollup of the recipe count and the price / time_minutes
+    totals and extremes, maintained incrementally by recipe.stats"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats'
+    )
+    recipe_count = models.PositiveIntegerField(default=0)
+    price_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    price_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    price_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    time_minutes_total = models.BigIntegerField(default=0)
+    time_minutes_min = models.IntegerField(null=True)
+    time_minutes_max = models.IntegerField(null=True)
+
+
+class ChangeLogWriter(models.Model):
+    """one row per user, locked while the user's change log entries are
+    written so that they commit in id order; kept apart from the user row
+    so logging never waits on, or holds up, profile updates"""
+    # no FK constraint, for the same reason as ChangeLogEntry.user
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+
+
+class ChangeLogEntry(models.Model):
+    """append-only log of recipe/tag/ingredient changes, read by the delta
+    sync feed; ids are the monotonically increasing sync cursor"""
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = ((UPSERT, 'upsert'), (DELETE, 'delete'))
+
+    # no FK constraint: rows logged while a user is being deleted must not
+    # block the delete, they are dropped by compaction instead
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'model', 'object_id', 'id']),
+        ]
+
+    @staticmethod
+    def lock_writers(user_ids):
+        """hold the users' ChangeLogWriter rows until the transaction ends.
+        Ids are taken at insert, not at commit: without this a long
+        transaction could commit an entry below a cursor already handed out
+        past a later one. With it a user's entries commit in id order; a
+        user's writes wait for each other, nothing else does."""
+        user_ids = sorted(set(user_ids))
+        ChangeLogWriter.objects.bulk_create(
+            [ChangeLogWriter(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        list(ChangeLogWriter.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+             .values_list('user_id', flat=True))
+
+    @classmethod
+    def log(cls, instance, action):
+        with transaction.atomic():
+            cls.lock_writers([instance.user_id])
+            return cls.objects.create(
+                user_id=instance.user_id,
+                model=instance._meta.model_name,
+                object_id=instance.pk,
+                action=action
+            )
+
+    @classmethod
+    def log_upserts(cls, model_name, user_ids_by_pk):
+        with transaction.atomic():
+            cls.lock_writers(user_ids_by_pk.values())
+            cls.objects.bulk_create([
+                cls(user_id=user_id, model=model_name, object_id=pk, action=cls.UPSERT)
+                for pk, user_id in user_ids_by_pk.items()
+            ])
+
+    @classmethod
+    def log_recipe_upserts(cls, user_ids_by_recipe):
+        cls.log_upserts('recipe', user_ids_by_recipe)
+
+
+class RecipeImport(models.Model):
+    """progress of a `manage.py import_recipes` run over one source file,
+    committed together with each chunk so a crashed run resumes after the
+    last committed row"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    source_sha256 = models.CharField(max_length=64)
+    rows_done = models.BigIntegerField(default=0)
+    recipes_created = models.BigIntegerField(default=0)
+    rows_rejected = models.BigIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('user', 'source_sha256'),)
+
+
+RECIPE_ATTR_FIELDS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def bulk_insert(model, objs):
+    """bulk_create that leaves primary keys set on objs on every backend"""
+    features = connection.features
+    if getattr(features, 'can_return_rows_from_bulk_insert',
+               getattr(features, 'can_return_ids_from_bulk_insert', False)):
+        return model.objects.bulk_create(objs)
+    fields = [field for field in model._meta.local_concrete_fields if field is not model._meta.auto_field]
+    if connection.vendor == 'sqlite':
+        # one statement holds the write lock, so its rows take consecutive
+        # rowids ending at last_insert_rowid()
+        batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            model.objects.bulk_create(batch, batch_size=len(batch))
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT last_insert_rowid()')
+                last_id = cursor.fetchone()[0]
+            for pk, obj in zip(range(last_id - len(batch) + 1, last_id + 1), batch):
+                obj.pk = pk
+        return objs
+    # one INSERT per row, still without the signals save() would send
+    for obj in objs:
+        obj.pk = model._base_manager._insert([obj], fields=fields, return_id=True, using=connection.alias)
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
+
+
+def insert_rows(model, field_names, rows):
+    """INSERT value tuples of field_names with one executemany; for rows
+    so many and so simple that building model instances would cost more
+    than the INSERT itself"""
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(name).column) for name in field_names)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO %s (%s) VALUES (%s)' % (
+                quote(opts.db_table), columns, ', '.join(['%s'] * len(field_names))
+            ),
+            rows
+        )
+
+
+def insert_rows_ignoring_conflicts(model, field_names, rows):
+    """INSERT value tuples of field_names, skipping those that hit a unique
+    constraint; returns the ids of the rows actually inserted, which
+    bulk_create(ignore_conflicts=True) cannot tell"""
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(name).column) for name in field_names)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(field_names))
+    ids = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            batch_size = max(connection.ops.bulk_batch_size(field_names, rows), 1)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    'INSERT INTO %s (%s) VALUES %s ON CONFLICT DO NOTHING RETURNING %s' % (
+                        quote(opts.db_table), columns, ', '.join([placeholders] * len(batch)),
+                        quote(opts.pk.column)
+                    ),
+                    [value for row in batch for value in row]
+                )
+                ids.extend(pk for pk, in cursor.fetchall())
+            return ids
+        # one row at a time, the row count telling whether it went in
+        sql = '%s %s (%s) VALUES %s' % (
+            connection.ops.insert_statement(ignore_conflicts=True), quote(opts.db_table), columns, placeholders
+        )
+        for row in rows:
+            cursor.execute(sql, row)
+            if cursor.rowcount == 1:
+                ids.append(cursor.lastrowid)
+    return ids
+
+
+def update_rows(model, field_names, rows):
+    """UPDATE field_names from (pk, *values) tuples with one executemany,
+    instead of the CASE per field bulk_update() builds"""
+    opts = model._meta
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(opts.get_field(name).column)} = %s' for name in field_names)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'UPDATE %s SET %s WHERE %s = %%s' % (quote(opts.db_table), assignments, quote(opts.pk.column)),
+            [tuple(values) + (pk,) for pk, *values in rows]
+        )
+
+
+# sent with user_id and recipe_ids after recipes were inserted or updated
+# through paths that bypass save() and m2m_changed (bulk_create/bulk_update);
+# created=True when they were all just inserted, links included, otherwise
+# link_deltas={Tag or Ingredient: {pk: links added minus removed}} and
+# previous={recipe id: {field name: value before the update}}
+recipes_bulk_changed = Signal()
+
+# sent by Tag or Ingredient with user_id and ids after rows were inserted
+# with bulk_create, i.e. without post_save
+recipe_attrs_bulk_created = Signal()
+
+# sent with recipe_ids (and exclude, a tag or ingredient whose links are
+# about to go away) when the tags or ingredients linked to recipes changed
+recipe_links_changed = Signal()
+
+
+SEARCH_CONFIG = 'english'
+
+
+def recipe_search_vector():
+    return (SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('search_text', weight='B', config=SEARCH_CONFIG))
+
+
+def refresh_search_text(recipe_ids, exclude=None):
+    """recompute the indexed tag/ingredient names of recipes, returns
+    {id: text}; exclude is a tag or ingredient whose links are going away"""
+    names = {pk: [] for pk in recipe_ids}
+    if not names:
+        return {}
+    for model, field_name in RECIPE_ATTR_FIELDS.items():
+        field = Recipe._meta.get_field(field_name)
+        target = field.m2m_reverse_field_name()
+        links = field.remote_field.through.objects.filter(recipe_id__in=names)
+        if isinstance(exclude, model):
+            links = links.exclude(**{f'{target}_id': exclude.pk})
+        for recipe_id, name in links.order_by(f'{target}_id').values_list('recipe_id', f'{target}__name'):
+            names[recipe_id].append(name)
+
+    texts = {pk: ' '.join(parts) for pk, parts in names.items()}
+    update_rows(Recipe, ['search_text'], texts.items())
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(id__in=texts).update(search_vector=recipe_search_vector())
+    return texts
+
+
+def touch_recipes(recipes, exclude=None, links_changed=True):
+    """mark recipes modified without going through save(): bump updated_at,
+    refresh their search text and record them in the change log"""
+    user_ids_by_recipe = dict(recipes.values_list('id', 'user_id'))
+    if not user_ids_by_recipe:
+        return {}
+    Recipe.objects.filter(id__in=user_ids_by_recipe).update(updated_at=timezone.now())
+    ChangeLogEntry.log_recipe_upserts(user_ids_by_recipe)
+    if links_changed:
+        recipe_links_changed.send(sender=Recipe, recipe_ids=list(user_ids_by_recipe), exclude=exclude)
+    return refresh_search_text(list(user_ids_by_recipe), exclude)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_m2m_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.updated_at = timezone.now()
+            texts = touch_recipes(Recipe.objects.filter(pk=instance.pk))
+            instance.search_text = texts.get(instance.pk, instance.search_text)
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_recipes(Recipe.objects.filter(**{RECIPE_ATTR_FIELDS[type(instance)]: instance}), exclude=instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_attr_change(sender, instance, signal, created=False, **kwargs):
+    # nested tag/ingredient names are part of a recipe's representation
+    if not created:
+        deleted = signal is pre_delete
+        touch_recipes(
+            Recipe.objects.filter(**{RECIPE_ATTR_FIELDS[sender]: instance}),
+            exclude=instance if deleted else None,
+            links_changed=deleted
+        )
+
+
+def adjust_recipe_counts(model, deltas):
+    """add {pk: delta} to the recipe_count of tags or ingredients, one
+    atomic UPDATE per distinct delta"""
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, ids in by_delta.items():
+        model.objects.filter(pk__in=ids).update(recipe_count=models.F('recipe_count') + delta)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_recipes_on_m2m_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    attr_model = type(instance) if reverse else model
+    field = Recipe._meta.get_field(RECIPE_ATTR_FIELDS[attr_model])
+    source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+    if reverse:
+        source, target = target, source
+
+    if action == 'post_add' and pk_set:
+        # pk_set only holds the links that were actually new
+        deltas = {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() passes every pk it was given, linked or not
+        links = sender.objects.filter(**{source: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{target}__in': pk_set})
+        if reverse:
+            deltas = {instance.pk: -links.count()}
+        else:
+            deltas = dict.fromkeys(links.values_list(target, flat=True), -1)
+    else:
+        return
+    adjust_recipe_counts(attr_model, deltas)
+
+
+@receiver(pre_delete, sender=Recipe)
+def count_recipes_on_delete(sender, instance, **kwargs):
+    # the links go with the recipe without an m2m_changed
+    for model, field_name in RECIPE_ATTR_FIELDS.items():
+        field = Recipe._meta.get_field(field_name)
+        linked = field.remote_field.through.objects.filter(recipe_id=instance.pk).values_list(
+            f'{field.m2m_reverse_field_name()}_id', flat=True
+        )
+        adjust_recipe_counts(model, dict.fromkeys(linked, -1))
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, **kwargs):
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk=instance.pk).update(search_vector=recipe_search_vector())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def log_saved(sender, instance, **kwargs):
+    ChangeLogEntry.log(instance, ChangeLogEntry.UPSERT)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_deleted(sender, instance, **kwargs):
+    ChangeLogEntry.log(instance, ChangeLogEntry.DELETE)
+
+
+@receiver(recipes_bulk_changed)
+def log_bulk_changed(sender, user_id, recipe_ids, **kwargs):
+    ChangeLogEntry.log_recipe_upserts({pk: user_id for pk in recipe_ids})
+
+
+@receiver(recipes_bulk_changed)
+def refresh_search_on_bulk_change(sender, recipe_ids, **kwargs):
+    refresh_search_text(recipe_ids)
+
+
+@receiver(recipes_bulk_changed)
+def count_recipes_on_bulk_change(sender, user_id, recipe_ids, created=False, link_deltas=None, **kwargs):
+    for model, field_name in RECIPE_ATTR_FIELDS.items():
+        if not created:
+            if link_deltas is not None:
+                adjust_recipe_counts(model, link_deltas.get(model, {}))
+            else:
+                # nothing tells which links went away: recount them all
+                model.objects.filter(user_id=user_id).reconcile_recipe_counts()
+            continue
+        field = Recipe._meta.get_field(field_name)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        added = field.remote_field.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list(target).annotate(models.Count('id'))
+        adjust_recipe_counts(model, dict(added))
+
+
+@receiver(recipe_attrs_bulk_created)
+def log_attrs_bulk_created(sender, user_id, ids, **kwargs):
+    ChangeLogEntry.log_upserts(sender._meta.model_name, {pk: user_id for pk in ids})
@@ -1,10 +1,21 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
 from django.db.utils import OperationalError
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from django.db.utils import ConnectionHandler
 
+from core.models import ChangeLogEntry, ChangeLogWriter, Ingredient, Recipe, Tag
+from recipe.importer import import_chunk
+
 
 class CommandTest(TestCase):
 
@@ -23,3 +34,138 @@ class CommandTest(TestCase):
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
 
+
+class CompactChangeLogTest(TestCase):
+
+    def test_compaction_keeps_latest_entry_per_object(self):
+        user = get_user_model().objects.create_user('log@gmail.com', 'pass123')
+        tag = Tag.objects.create(user=user, name='vegan')
+        tag.name = 'vegetarian'
+        tag.save()
+        old = ChangeLogEntry.objects.create(
+            user=user, model='tag', object_id=0, action=ChangeLogEntry.DELETE
+        )
+        ChangeLogEntry.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=365))
+
+        call_command('compact_change_log', stdout=StringIO())
+
+        entries = ChangeLogEntry.objects.filter(user=user)
+        self.assertEqual(entries.count(), 1)
+        self.assertEqual(entries.get().object_id, tag.id)
+
+    def test_compaction_drops_writer_rows_of_deleted_users(self):
+        user = get_user_model().objects.create_user('gone@gmail.com', 'pass123')
+        kept = get_user_model().objects.create_user('kept@gmail.com', 'pass123')
+        ChangeLogEntry.lock_writers([user.pk, kept.pk])
+        user.delete()
+
+        call_command('compact_change_log', stdout=StringIO())
+
+        self.assertEqual(list(ChangeLogWriter.objects.values_list('user_id', flat=True)), [kept.pk])
+
+
+class ReconcileRecipeCountsTest(TestCase):
+
+    def test_drifted_counters_are_reported_and_fixed(self):
+        user = get_user_model().objects.create_user('counts@gmail.com', 'pass123')
+        tag = Tag.objects.create(user=user, name='vegan')
+        recipe = Recipe.objects.create(user=user, title='soup', time_minutes=5, price=1)
+        recipe.tags.add(tag)
+        Tag.objects.filter(pk=tag.pk).update(recipe_count=5)
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_recipe_counts', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_recipe_counts', stdout=out)
+
+        self.assertIn('1 had drifted', out.getvalue())
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
+
+class ImportRecipesTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('import@gmail.com', 'pass123')
+        self.vegan = Tag.objects.create(user=self.user, name='vegan')
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, lines):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_recipes', path, '--user', self.user.email, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def ndjson(self, count):
+        return [
+            json.dumps({'title': f'soup {i}', 'time_minutes': 10 + i, 'price': '2.50',
+                        'tags': ['vegan', 'quick'], 'ingredients': ['salt']})
+            for i in range(count)
+        ]
+
+    def test_import_ndjson(self):
+        path = self.write('recipes.ndjson', self.ndjson(3) + [
+            '{"title": "broken", "time_minutes": "soon", "price": "1"}',
+            'not json',
+        ])
+
+        out, err = self.run_import(path, '--chunk-size', '2')
+
+        self.assertIn('imported 3 recipes from 5 rows (2 rejected)', out)
+        self.assertIn('row 4:', err)
+        self.assertIn('row 5:', err)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        # names resolve to existing rows, missing ones are created once
+        self.assertEqual(
+            dict(Tag.objects.filter(user=self.user).values_list('name', 'recipe_count')),
+            {'vegan': 3, 'quick': 3}
+        )
+        self.assertEqual(Ingredient.objects.get(user=self.user).recipe_count, 3)
+        recipe = Recipe.objects.get(title='soup 1')
+        self.assertEqual(set(recipe.tags.values_list('name', flat=True)), {'vegan', 'quick'})
+
+    def test_import_csv(self):
+        path = self.write('recipes.csv', [
+            'title,time_minutes,price,link,tags,ingredients',
+            'omelette,5,3.00,,"[""vegan""]","[""egg"", ""salt, sea""]"',
+        ])
+
+        self.run_import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'omelette')
+        self.assertEqual(set(recipe.ingredients.values_list('name', flat=True)), {'egg', 'salt, sea'})
+
+    def test_resume_after_crash(self):
+        path = self.write('recipes.ndjson', self.ndjson(5))
+        calls = []
+
+        def crash_on_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            return import_chunk(*args)
+
+        with patch('recipe.importer.import_chunk', side_effect=crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, '--chunk-size', '2')
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+        out, _ = self.run_import(path, '--chunk-size', '2')
+
+        self.assertIn('resuming after row 2', out)
+        self.assertEqual(
+            sorted(Recipe.objects.filter(user=self.user).values_list('title', flat=True)),
+            [f'soup {i}' for i in range(5)]
+        )
+        out, _ = self.run_import(path)
+        self.assertIn('pass --restart', out)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
@@ -66,3 +66,44 @@ class ModelTests(TestCase):
         exp_path = f'uploads/recipe/{uuid}.jpg'
 
         self.assertEqual(file_path, exp_path)
+
+    def test_recipe_touched_by_tag_changes(self):
+        user = sample_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='ghorme sabzi',
+            time_minutes=5,
+            price=6.00
+        )
+        tag = models.Tag.objects.create(user=user, name='vegan')
+        before = recipe.updated_at
+
+        recipe.tags.add(tag)
+        recipe.refresh_from_db()
+        added = recipe.updated_at
+        tag.name = 'vegetarian'
+        tag.save()
+        recipe.refresh_from_db()
+
+        self.assertGreater(added, before)
+        self.assertGreater(recipe.updated_at, added)
+
+    def test_recipe_search_text_follows_tags_and_ingredients(self):
+        user = sample_user()
+        recipe = models.Recipe.objects.create(user=user, title='ghorme sabzi', time_minutes=5, price=6.00)
+        tag = models.Tag.objects.create(user=user, name='vegan')
+        ingredient = models.Ingredient.objects.create(user=user, name='beans')
+
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        self.assertEqual(recipe.search_text, 'vegan beans')
+
+        tag.name = 'vegetarian'
+        tag.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.search_text, 'vegetarian beans')
+
+        tag.delete()
+        ingredient.recipe_set.clear()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.search_text, '')
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        # connects the response cache invalidation, image release, stats
+        # rollup and in-memory index receivers
+        from recipe import autocomplete, cache, images, matching, similarity, stats  # noqa: F401
@@ -0,0 +1,97 @@
+from bisect import bisect_left, insort
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, Tag, recipe_attrs_bulk_created
+from recipe.cache import bump_data_version, bump_data_version_on_commit
+from recipe.indexes import user_indexes
+
+
+class PrefixIndex:
+    """(casefolded name, id) pairs kept sorted, so the names starting with
+    a prefix are one bisect away and come out in alphabetical order"""
+
+    def __init__(self, rows):
+        self.keys = sorted((name.casefold(), pk) for pk, name in rows)
+        self.names = dict(rows)
+
+    def add(self, pk, name):
+        self.remove(pk)
+        insort(self.keys, (name.casefold(), pk))
+        self.names[pk] = name
+
+    def remove(self, pk):
+        name = self.names.pop(pk, None)
+        if name is None:
+            return
+        i = bisect_left(self.keys, (name.casefold(), pk))
+        if i < len(self.keys) and self.keys[i] == (name.casefold(), pk):
+            del self.keys[i]
+
+    def search(self, prefix, limit):
+        prefix = prefix.casefold()
+        matches = []
+        i = bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(matches) < limit:
+            key, pk = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            matches.append({'id': pk, 'name': self.names[pk]})
+            i += 1
+        return matches
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def index_kind(model):
+    return model._meta.model_name
+
+
+def get_index(model, user_id):
+    def build(user_id):
+        return PrefixIndex(list(model.objects.filter(user_id=user_id).values_list('id', 'name')))
+    kind = index_kind(model)
+    return user_indexes.get(kind, user_id, build, scope=kind)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_index(sender, instance, signal, created=False, **kwargs):
+    kind = index_kind(sender)
+    if signal is post_delete:
+        def change(index):
+            index.remove(instance.pk)
+    elif created:
+        def change(index):
+            index.add(instance.pk, instance.name)
+    else:
+        # renames are rare enough to simply rebuild
+        change = None
+
+    def patch(version, committed_version):
+        # an index loaded before the write is patched in place once it is
+        # committed, unless another write bumped the version meanwhile (a
+        # rollback just leaves it to be rebuilt)
+        if change is not None and committed_version == version + 1:
+            user_indexes.apply(kind, instance.user_id, version - 1, committed_version, change)
+
+    bump_data_version_on_commit(instance.user_id, scope=kind, on_commit=patch)
+
+
+@receiver(recipe_attrs_bulk_created)
+def invalidate_on_bulk_create(sender, user_id, **kwargs):
+    # rebuilt on next use, bulk inserts are too large to patch in
+    bump_data_version_on_commit(user_id, scope=index_kind(sender))
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_on_user_created(sender, instance, created, **kwargs):
+    # indexes are kept per user id; a reused id must not find an old one
+    if created:
+        for model in (Tag, Ingredient):
+            bump_data_version(instance.pk, scope=index_kind(model))
@@ -0,0 +1,161 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from core.models import (
+    Recipe, bulk_insert, insert_rows, insert_rows_ignoring_conflicts, recipe_attrs_bulk_created,
+    recipes_bulk_changed,
+)
+from recipe.serializers import RecipeBulkItemSerializer
+
+RELATED_FIELDS = ('tags', 'ingredients')
+# names per lookup, two bound parameters each, below SQLite's limit of 999
+NAME_BATCH_SIZE = 400
+
+
+def _owned_related_ids(user, items):
+    """every tag/ingredient id referenced by the batch that belongs to user,
+    one query per relation"""
+    owned = {}
+    for name in RELATED_FIELDS:
+        requested = {pk for data in items for pk in data.get(name, ())}
+        model = Recipe._meta.get_field(name).related_model
+        owned[name] = set(
+            model.objects.filter(user=user, id__in=requested).values_list('id', flat=True)
+        ) if requested else set()
+    return owned
+
+
+def validate_items(user, indexed_items, partial=False):
+    """validate (index, item) pairs one by one, checking related ids for the
+    whole batch at once; returns ([(index, data)], [errors])"""
+    valid, errors = [], []
+    for index, raw in indexed_items:
+        serializer = RecipeBulkItemSerializer(data=raw, partial=partial)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    owned = _owned_related_ids(user, [data for _, data in valid])
+    checked = []
+    for index, data in valid:
+        item_errors = {
+            name: [f'Invalid pk "{pk}" - object does not exist.'
+                   for pk in data[name] if pk not in owned[name]]
+            for name in RELATED_FIELDS if name in data
+        }
+        item_errors = {name: messages for name, messages in item_errors.items() if messages}
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            checked.append((index, data))
+
+    errors.sort(key=lambda error: error['index'])
+    return checked, errors
+
+
+def _scalar_fields(data):
+    return {name: value for name, value in data.items() if name not in RELATED_FIELDS}
+
+
+def _insert_links(recipes_with_data):
+    for name in RELATED_FIELDS:
+        field = Recipe._meta.get_field(name)
+        rows = [
+            (recipe.pk, pk)
+            for recipe, data in recipes_with_data
+            for pk in set(data.get(name, ()))
+        ]
+        if rows:
+            insert_rows(field.remote_field.through, [field.m2m_field_name(), field.m2m_reverse_field_name()], rows)
+
+
+def create_recipes(user, items):
+    """insert validated items with one INSERT per table, in one transaction"""
+    with transaction.atomic():
+        recipes = bulk_insert(Recipe, [Recipe(user=user, **_scalar_fields(data)) for data in items])
+        _insert_links(list(zip(recipes, items)))
+        recipes_bulk_changed.send(
+            sender=Recipe, user_id=user.pk, recipe_ids=[r.pk for r in recipes], created=True
+        )
+    return recipes
+
+
+def update_recipes(user, recipes, items):
+    """apply validated partial items to recipes (same order) with a single
+    bulk UPDATE; tags/ingredients given in an item replace the old links"""
+    now = timezone.now()
+    fields = {'updated_at'}
+    previous = {}
+    for recipe, data in zip(recipes, items):
+        for name, value in _scalar_fields(data).items():
+            previous.setdefault(recipe.pk, {})[name] = getattr(recipe, name)
+            setattr(recipe, name, value)
+            fields.add(name)
+        recipe.updated_at = now
+
+    with transaction.atomic():
+        Recipe.objects.bulk_update(recipes, sorted(fields))
+        link_deltas = {}
+        for name in RELATED_FIELDS:
+            field = Recipe._meta.get_field(name)
+            deltas = link_deltas[field.related_model] = Counter()
+            relinked = [recipe.pk for recipe, data in zip(recipes, items) if name in data]
+            if relinked:
+                links = field.remote_field.through.objects.filter(recipe_id__in=relinked)
+                removed = links.order_by().values_list(f'{field.m2m_reverse_field_name()}_id').annotate(Count('id'))
+                deltas.subtract(dict(removed))
+                links.delete()
+            deltas.update(pk for data in items if name in data for pk in set(data[name]))
+        _insert_links([
+            (recipe, {name: data[name] for name in RELATED_FIELDS if name in data})
+            for recipe, data in zip(recipes, items)
+        ])
+        recipes_bulk_changed.send(
+            sender=Recipe, user_id=user.pk, recipe_ids=[r.pk for r in recipes],
+            link_deltas=link_deltas, previous=previous
+        )
+    return recipes
+
+
+def _find_names(user, model, names):
+    """{lowercase name: (id, name)} of the user's rows called names ignoring
+    case, the oldest row where several match"""
+    found = {}
+    for start in range(0, len(names), NAME_BATCH_SIZE):
+        batch = names[start:start + NAME_BATCH_SIZE]
+        # the exact names too: SQLite's LOWER() only folds ASCII letters
+        rows = model.objects.annotate(name_key=Lower('name')).filter(
+            Q(name_key__in=[name.lower() for name in batch]) | Q(name__in=batch), user=user
+        ).order_by('-id').values_list('id', 'name')
+        found.update((name.lower(), (pk, name)) for pk, name in rows)
+    return found
+
+
+def upsert_names(user, model, names):
+    """{name: (id, stored name, created)} for each of names among the
+    user's tags or ingredients, matched ignoring case; the missing ones are
+    inserted with INSERT ... ON CONFLICT DO NOTHING against the unique
+    (user, LOWER(name)) index, so concurrent upserts of a name all end up
+    with the one row that won, and only its inserter reports it created"""
+    names = list(dict.fromkeys(names))
+    with transaction.atomic():
+        found = _find_names(user, model, names)
+        missing = {}
+        for name in names:
+            if name.lower() not in found:
+                missing.setdefault(name.lower(), name)
+        created = set()
+        if missing:
+            # a name taken meanwhile by a concurrent upsert, or by a row
+            # that only the database's LOWER() matches, is not ours
+            created = set(insert_rows_ignoring_conflicts(
+                model, ('user', 'name', 'recipe_count'), [(user.pk, name, 0) for name in missing.values()]
+            ))
+            found.update(_find_names(user, model, list(missing.values())))
+            recipe_attrs_bulk_created.send(sender=model, user_id=user.pk, ids=sorted(created))
+    return {name: found[name.lower()] + (found[name.lower()][0] in created,) for name in names}
@@ -0,0 +1,184 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from core.models import Tag, Ingredient, Recipe, recipe_attrs_bulk_created, recipes_bulk_changed
+
+
+def get_cache():
+    return caches[getattr(settings, 'RECIPE_RESPONSE_CACHE', 'default')]
+
+
+def _version_key(user_id, scope):
+    return f'recipe-{scope}-version:{user_id}'
+
+
+def _version_seed():
+    # a clock based seed means a version lost to eviction is never handed out again
+    return int(time.time() * 1000000)
+
+
+def get_data_version(user_id, scope='data'):
+    """current version of everything the user owns, bumped on every change;
+    a narrower scope (e.g. 'tag') only moves with changes to that kind"""
+    cache = get_cache()
+    key = _version_key(user_id, scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _version_seed(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id, scope='data'):
+    cache = get_cache()
+    key = _version_key(user_id, scope)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _version_seed(), None)
+        return cache.get(key)
+
+
+def bump_data_version_on_commit(user_id, scope='data', on_commit=None):
+    """bump at once and again once the current transaction commits: a
+    request reading in between saw the old rows and may have stored them
+    under the first bump. on_commit(version, committed_version) runs after
+    the second bump; returns the first version"""
+    version = bump_data_version(user_id, scope)
+
+    def committed():
+        committed_version = bump_data_version(user_id, scope)
+        if on_commit is not None:
+            on_commit(version, committed_version)
+
+    transaction.on_commit(committed)
+    return version
+
+
+def response_cache_key(request):
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    digest = hashlib.md5(
+        repr((request.build_absolute_uri(request.path), params)).encode()
+    ).hexdigest()
+    version = get_data_version(request.user.pk)
+    return f'recipe-response:{request.user.pk}:{version}:{digest}'
+
+
+def response_etag(request, *args, **kwargs):
+    """ETag derived from the data version alone, so it costs no query"""
+    key = response_cache_key(request)
+    return hashlib.md5(f'{key}:{request.accepted_media_type}'.encode()).hexdigest()
+
+
+RECIPE_LINKS = {'tags': Tag, 'ingredients': Ingredient}
+
+
+def recipe_links_shown(request):
+    """the link fields a recipe detail response includes, as the view's
+    ?fields= and ?expand= handling decides"""
+    fields = request.query_params.get('fields')
+    if fields is None:
+        return sorted(RECIPE_LINKS)
+    names = {name.strip() for name in f"{fields},{request.query_params.get('expand', '')}".split(',')}
+    return sorted(names & set(RECIPE_LINKS))
+
+
+def make_recipe_etag(request, pk, updated_at, links):
+    """ETag of one recipe from its own updated_at and the (id, usage count)
+    of the linked rows shown, links being {field name: pairs}; writes to
+    the user's other recipes leave it valid. Renames touch updated_at, the
+    usage counts shown next to each tag and ingredient do not."""
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    links = sorted((name, sorted(pairs)) for name, pairs in links.items())
+    return hashlib.md5(
+        repr((str(pk), updated_at.isoformat(), links, params, request.accepted_media_type)).encode()
+    ).hexdigest()
+
+
+def recipe_etag(request, pk=None, **kwargs):
+    # like recipe_last_modified only looked up for a conditional request;
+    # the view sets the ETag of full responses from what it loaded
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    updated_at = Recipe.objects.filter(
+        user=request.user, pk=pk
+    ).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    links = {
+        name: list(RECIPE_LINKS[name].objects.filter(recipe=pk).values_list('id', 'recipe_count'))
+        for name in recipe_links_shown(request)
+    }
+    return make_recipe_etag(request, pk, updated_at, links)
+
+
+def recipe_last_modified(request, pk=None, **kwargs):
+    # only worth a query when the client can use the answer; the view sets
+    # Last-Modified on full responses from the instance it loaded anyway.
+    # HTTP dates have whole seconds: a client sending If-Modified-Since
+    # alone misses a second change within the second it last read. The
+    # ETag has no such gap and wins when both headers are sent.
+    if 'HTTP_IF_MODIFIED_SINCE' not in request.META:
+        return None
+    return Recipe.objects.filter(
+        user=request.user, pk=pk
+    ).values_list('updated_at', flat=True).first()
+
+
+class CachedListMixin:
+    """serve list responses from the cache under the user's data version;
+    any write bumps the version so stale entries are simply never read again"""
+
+    def list(self, request, *args, **kwargs):
+        cache = get_cache()
+        key = response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'RECIPE_RESPONSE_CACHE_TIMEOUT', 300))
+        return response
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_on_change(sender, instance, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_data_version_on_commit(instance.user_id)
+
+
+@receiver(recipes_bulk_changed)
+@receiver(recipe_attrs_bulk_created)
+def bump_on_bulk_change(sender, user_id, **kwargs):
+    bump_data_version_on_commit(user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def bump_on_user_created(sender, instance, created, **kwargs):
+    # keys are per user id; a fresh user must never see entries of a reused id
+    if created:
+        bump_data_version(instance.pk)
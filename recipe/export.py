@@ -0,0 +1,117 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+
+from core.models import RECIPE_ATTR_FIELDS, Recipe
+
+EXPORT_FIELDS = ('id', 'title', 'time_minutes', 'price', 'link')
+
+
+class NDJSONRenderer(JSONRenderer):
+    """selects the export format; the rows are streamed by the view, only
+    error responses are rendered (as plain JSON)"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class FallbackNegotiation(DefaultContentNegotiation):
+    """an Accept header naming none of the export formats (application/json
+    say) gets the first renderer rather than 406"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+def export_rows(user_id, chunk_size):
+    """the user's recipes in id order, tags and ingredients given by name;
+    read through one server-side cursor with the names of each chunk of
+    recipes looked up in one query per relation"""
+    rows = Recipe.objects.filter(user_id=user_id).order_by('id').values_list(
+        *EXPORT_FIELDS
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        ids = [row[0] for row in chunk]
+        names = {}
+        for field_name in RECIPE_ATTR_FIELDS.values():
+            field = Recipe._meta.get_field(field_name)
+            target = field.m2m_reverse_field_name()
+            names[field_name] = defaultdict(list)
+            links = field.remote_field.through.objects.filter(recipe_id__in=ids).order_by(
+                f'{target}__name', f'{target}_id'
+            ).values_list('recipe_id', f'{target}__name')
+            for recipe_id, name in links:
+                names[field_name][recipe_id].append(name)
+
+        for row in chunk:
+            item = dict(zip(EXPORT_FIELDS, row))
+            item['price'] = str(item['price'])
+            for field_name, by_recipe in names.items():
+                item[field_name] = by_recipe.get(item['id'], [])
+            yield item
+
+
+def ndjson_lines(items):
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + '\n'
+
+
+# a spreadsheet runs a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    if isinstance(value, list):
+        # name lists as JSON arrays, so any name survives the round trip
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    """file-like object handing back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(items):
+    writer = csv.writer(Echo())
+    columns = EXPORT_FIELDS + tuple(RECIPE_ATTR_FIELDS.values())
+    yield writer.writerow(columns)
+    for item in items:
+        yield writer.writerow([csv_cell(item[column]) for column in columns])
+
+
+FORMATS = {
+    NDJSONRenderer.format: ndjson_lines,
+    CSVRenderer.format: csv_lines,
+}
+
+
+def streaming_response(user_id, renderer):
+    chunk_size = getattr(settings, 'RECIPE_EXPORT_CHUNK_SIZE', 2000)
+    response = StreamingHttpResponse(
+        FORMATS[renderer.format](export_rows(user_id, chunk_size)),
+        content_type=f'{renderer.media_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="recipes.{renderer.format}"'
+    return response
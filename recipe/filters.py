@@ -0,0 +1,16 @@
+from rest_framework.filters import OrderingFilter
+
+
+class AliasOrderingFilter(OrderingFilter):
+    """?ordering= accepting public names for model fields (view.ordering_aliases,
+    e.g. usage -> recipe_count); id breaks ties so keyset pages stay stable"""
+
+    def get_ordering(self, request, queryset, view):
+        aliases = getattr(view, 'ordering_aliases', {})
+        ordering = []
+        for term in super().get_ordering(request, queryset, view) or ():
+            name = term.lstrip('-')
+            ordering.append(term[:len(term) - len(name)] + aliases.get(name, name))
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering.append('id')
+        return tuple(ordering)
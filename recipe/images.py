@@ -0,0 +1,300 @@
+import io
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe, RecipeImageJob
+from recipe.storage import ContentAddressedStorage
+
+STAGING_DIR = 'uploads/staging/'
+
+# same root as default_storage, so stored names resolve through either
+blob_storage = ContentAddressedStorage()
+
+
+class ImageRejected(Exception):
+    pass
+
+
+def stage_upload(recipe, upload):
+    """park the raw upload in the staging area and queue it for the worker"""
+    ext = os.path.splitext(upload.name)[1].lower()[:10]
+    staged = default_storage.save(os.path.join(STAGING_DIR, f'{uuid.uuid4()}{ext}'), upload)
+    return queue_staged(recipe, staged)
+
+
+def queue_staged(recipe, staged):
+    """hand a complete file in the staging area to the image worker"""
+    job = RecipeImageJob.objects.create(recipe=recipe, staged_file=staged)
+    if getattr(settings, 'RECIPE_IMAGE_EAGER', False):
+        transaction.on_commit(lambda: process_job(job))
+    return job
+
+
+def job_lease():
+    return timedelta(seconds=getattr(settings, 'RECIPE_IMAGE_JOB_LEASE', 300))
+
+
+def claim_job():
+    """lease the oldest pending job, or one whose worker let its lease run
+    out, mark it as processing and return it, or None"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = RecipeImageJob.objects.filter(
+            Q(status=RecipeImageJob.PENDING) | Q(status=RecipeImageJob.PROCESSING, locked_until__lt=now)
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        job = jobs.first()
+        if job is None:
+            return None
+        job.status = RecipeImageJob.PROCESSING
+        job.locked_by = uuid.uuid4().hex
+        job.locked_until = now + job_lease()
+        job.save(update_fields=['status', 'locked_by', 'locked_until', 'updated_at'])
+    return job
+
+
+def renew_lease(job):
+    """extend the job's lease; False when it ran out and another worker
+    took the job over, which then owns it"""
+    if not job.locked_by:
+        # processed right after its request, never queued
+        return True
+    job.locked_until = timezone.now() + job_lease()
+    renewed = RecipeImageJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        locked_until=job.locked_until, updated_at=timezone.now()
+    )
+    # a job that went with its recipe has no other owner either
+    return bool(renewed) or not RecipeImageJob.objects.filter(pk=job.pk).exists()
+
+
+def requeue_stale_jobs():
+    """hand jobs whose worker let its lease run out back to the queue"""
+    return RecipeImageJob.objects.filter(
+        status=RecipeImageJob.PROCESSING,
+        locked_until__lt=timezone.now()
+    ).update(status=RecipeImageJob.PENDING, locked_by='', locked_until=None)
+
+
+def reencode(source):
+    """decode, apply and drop EXIF, bound the size and encode as JPEG"""
+    try:
+        with Image.open(source) as probe:
+            probe.verify()
+        source.seek(0)
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            max_size = getattr(settings, 'RECIPE_IMAGE_MAX_SIZE', 2048)
+            img.thumbnail((max_size, max_size))
+            out = io.BytesIO()
+            # no exif= argument: the output carries no metadata
+            img.save(out, format='JPEG', quality=85, optimize=True)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise ImageRejected(str(exc) or 'not a valid image')
+    return out.getvalue()
+
+
+VARIANT_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+
+def variant_widths():
+    return getattr(settings, 'RECIPE_IMAGE_VARIANT_WIDTHS', (320, 640, 1280))
+
+
+def variant_formats():
+    return getattr(settings, 'RECIPE_IMAGE_VARIANT_FORMATS', ('jpeg', 'webp'))
+
+
+def variant_name(source_name, width, fmt):
+    """deterministic storage name of a derivative, kept in a directory named
+    after the source so replacing the source can drop them all"""
+    stem = os.path.splitext(source_name)[0]
+    return f'{stem}/{width}w.{fmt}'
+
+
+def variant_names(source_name):
+    return [variant_name(source_name, width, fmt)
+            for fmt in variant_formats() for width in variant_widths()]
+
+
+def render_variant(img, width, fmt):
+    img = img.copy()
+    # never upscales; narrow sources give the same bytes for wider keys
+    img.thumbnail((width, width * 10))
+    out = io.BytesIO()
+    img.save(out, format=VARIANT_FORMATS[fmt], quality=80)
+    return out.getvalue()
+
+
+def save_variant(name, data):
+    """write data under exactly name, replacing what is there; concurrent
+    writers of one variant each rename a complete temporary file over it,
+    so none of them sees a partial file or leaves a renamed copy behind"""
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # remote storages (e.g. S3) overwrite an existing key in place
+        default_storage.save(name, ContentFile(data))
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(temporary, default_storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def generate_variants(source_name, only=None):
+    """write the width bounded variants of source_name (or just the
+    (width, fmt) pairs in only), returns the names written"""
+    wanted = only or [(width, fmt) for fmt in variant_formats() for width in variant_widths()]
+    written = []
+    with default_storage.open(source_name) as source, Image.open(source) as img:
+        img.load()
+        for width, fmt in wanted:
+            name = variant_name(source_name, width, fmt)
+            save_variant(name, render_variant(img, width, fmt))
+            written.append(name)
+    return written
+
+
+def ensure_variant(source_name, width, fmt):
+    """lazily create a single variant on first use"""
+    name = variant_name(source_name, width, fmt)
+    if not default_storage.exists(name):
+        generate_variants(source_name, only=[(width, fmt)])
+    return name
+
+
+def delete_image(name):
+    """remove an image file together with its variants"""
+    for variant in variant_names(name):
+        default_storage.delete(variant)
+    default_storage.delete(name)
+    try:
+        os.rmdir(default_storage.path(os.path.splitext(name)[0]))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def retain_blob(name, data):
+    """take a reference on a stored blob, writing it again if it was
+    collected meanwhile; call inside a transaction"""
+    blob, _ = ImageBlob.objects.select_for_update().get_or_create(name=name)
+    if not blob_storage.exists(name):
+        blob_storage.save(name, ContentFile(data))
+    if getattr(settings, 'RECIPE_IMAGE_VARIANTS_EAGER', True):
+        missing = [
+            (width, fmt) for fmt in variant_formats() for width in variant_widths()
+            if not default_storage.exists(variant_name(name, width, fmt))
+        ]
+        if missing:
+            generate_variants(name, only=missing)
+    ImageBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+
+
+def release_blob(name):
+    """drop a reference; the file goes once nothing points at it any more"""
+    released = ImageBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+    if released:
+        transaction.on_commit(lambda: collect_blob(name))
+    elif not ImageBlob.objects.filter(name=name).exists():
+        # stored before content addressing, owned by this recipe alone
+        transaction.on_commit(lambda: delete_image(name))
+
+
+def collect_blob(name):
+    # re-checked under the row lock: a concurrent upload of the same bytes
+    # may have taken a new reference since the release committed
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(name=name, refcount=0).first()
+        if blob is not None:
+            delete_image(name)
+            blob.delete()
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        release_blob(instance.image.name)
+
+
+@receiver(post_delete, sender=RecipeImageJob)
+def delete_staged_file(sender, instance, **kwargs):
+    # e.g. a recipe deleted before the worker got to its upload
+    transaction.on_commit(lambda: default_storage.delete(instance.staged_file))
+
+
+def finish_job(job, status, error=''):
+    job.status = status
+    job.error = error[:255]
+    jobs = RecipeImageJob.objects.filter(pk=job.pk)
+    if job.locked_by:
+        # a worker whose lease ran out leaves the job to its new owner
+        jobs = jobs.filter(locked_by=job.locked_by)
+    updated = jobs.update(status=status, error=job.error, updated_at=timezone.now())
+    # no row at all is fine: the job went with its recipe
+    if updated or not RecipeImageJob.objects.filter(pk=job.pk).exists():
+        default_storage.delete(job.staged_file)
+
+
+def process_job(job):
+    if not Recipe.objects.filter(pk=job.recipe_id).exists():
+        finish_job(job, RecipeImageJob.FAILED, 'recipe deleted')
+        return job.status
+    if RecipeImageJob.objects.filter(recipe_id=job.recipe_id, id__gt=job.id).exists():
+        finish_job(job, RecipeImageJob.FAILED, 'superseded by a newer upload')
+        return job.status
+
+    try:
+        with default_storage.open(job.staged_file) as source:
+            data = reencode(source)
+    except ImageRejected as exc:
+        finish_job(job, RecipeImageJob.FAILED, str(exc))
+        return job.status
+
+    # identical bytes land on the same name, so a photo uploaded by many
+    # users is stored once; the file is complete before any row points at it
+    name = blob_storage.save('image.jpg', ContentFile(data))
+    with transaction.atomic():
+        # still ours: a worker that took over an expired lease must not
+        # see the image set twice
+        leased = renew_lease(job)
+        recipe = Recipe.objects.select_for_update().filter(pk=job.recipe_id).first() if leased else None
+        if recipe is not None:
+            retain_blob(name, data)
+            old_name = recipe.image.name
+            recipe.image = name
+            recipe.save(update_fields=['image', 'updated_at'])
+            if old_name:
+                release_blob(old_name)
+    if recipe is None:
+        # nothing took a reference: unless other recipes hold the same
+        # bytes, the file just saved belongs to no one
+        if not ImageBlob.objects.filter(name=name).exists():
+            delete_image(name)
+        if leased:
+            finish_job(job, RecipeImageJob.FAILED, 'recipe deleted')
+    else:
+        finish_job(job, RecipeImageJob.DONE)
+    return job.status
@@ -0,0 +1,77 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+
+from core.models import RECIPE_ATTR_FIELDS, Recipe, Tag
+from recipe.bulk import create_recipes, upsert_names
+
+SCALAR_FIELDS = ('title', 'time_minutes', 'price', 'link')
+
+
+def read_ndjson(file):
+    """raw non-blank lines; decoded in clean_row so a resume can skip
+    rows without parsing them"""
+    for line in file:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def clean_names(value):
+    if isinstance(value, str):
+        # CSV cells hold the names as a JSON array, as written by the export
+        value = json.loads(value) if value.strip() else []
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValidationError('expected a list of names')
+    field = Tag._meta.get_field('name')
+    return [field.clean(name.strip(), None) for name in value]
+
+
+def clean_row(row):
+    """validated scalar fields plus tag and ingredient names of one row, in
+    the format of the recipe export; raises ValidationError or ValueError"""
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValidationError('expected an object')
+    data = {}
+    for name in SCALAR_FIELDS:
+        field = Recipe._meta.get_field(name)
+        value = row.get(name)
+        data[name] = field.clean('' if value is None and field.blank else value, None)
+    for name in RECIPE_ATTR_FIELDS.values():
+        data[name] = clean_names(row.get(name) or [])
+    return data
+
+
+def import_chunk(user, rows, known):
+    """insert the valid rows of [(row number, raw row)] for user; known is
+    {model: {name: id}}, kept by the caller across chunks so every name is
+    looked up (ignoring case) once; returns (recipes created, [(row number,
+    error)])"""
+    items, rejected = [], []
+    for number, raw in rows:
+        try:
+            items.append(clean_row(raw))
+        except ValidationError as exc:
+            rejected.append((number, '; '.join(exc.messages)))
+        except ValueError as exc:
+            rejected.append((number, str(exc)))
+
+    for model, field_name in RECIPE_ATTR_FIELDS.items():
+        ids = known.setdefault(model, {})
+        unknown = {name for item in items for name in item[field_name]} - ids.keys()
+        if unknown:
+            ids.update((name, pk) for name, (pk, _, _) in upsert_names(user, model, unknown).items())
+        for item in items:
+            item[field_name] = [ids[name] for name in item[field_name]]
+
+    return len(create_recipes(user, items)) if items else 0, rejected
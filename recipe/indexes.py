@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from recipe.cache import get_data_version
+
+
+class UserIndexCache:
+    """process-local LRU of in-memory indexes built from one user's data.
+
+    An entry is keyed by (kind, user id) and remembers the user's data
+    version it was built at; once any write bumps the version the next
+    lookup rebuilds it, so every process stays correct without fan-out.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, user_id, build, scope='data'):
+        """the current index, calling build(user_id) when missing or stale
+        against the user's data version of scope"""
+        key = (kind, user_id)
+        version = get_data_version(user_id, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        # built outside the lock; a concurrent build of the same key is
+        # wasted work, not a wrong answer
+        index = build(user_id)
+        if get_data_version(user_id, scope) != version:
+            # a write landed while building: the index may predate it
+            return index
+        with self._lock:
+            self._entries[key] = (version, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return index
+
+    def version_of(self, kind, user_id):
+        """version the loaded index was built or patched at, or None"""
+        with self._lock:
+            entry = self._entries.get((kind, user_id))
+            return entry[0] if entry is not None else None
+
+    def apply(self, kind, user_id, from_version, to_version, change):
+        """update an index built at from_version in place with change(index)
+        and mark it current at to_version; any other entry is left to be
+        rebuilt"""
+        with self._lock:
+            entry = self._entries.get((kind, user_id))
+            if entry is None or entry[0] != from_version:
+                return False
+            change(entry[1])
+            self._entries[(kind, user_id)] = (to_version, entry[1])
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_indexes = UserIndexCache(max_size=getattr(settings, 'RECIPE_INDEX_CACHE_SIZE', 256))
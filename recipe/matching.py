@@ -0,0 +1,146 @@
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, recipes_bulk_changed
+from recipe.cache import bump_data_version, bump_data_version_on_commit
+from recipe.indexes import user_indexes
+
+KIND = 'pantry'
+IngredientLinks = Recipe.ingredients.through
+
+
+class PantryMatrix:
+    """Sparse recipe x ingredient incidence of one user's recipes.
+
+    Packed as CSR: recipe_ids (sorted) with indptr into the ingredients
+    array, so scoring a pantry is a couple of vectorized passes. Rows
+    changed since packing live in `overrides` and are scored in Python
+    until there are enough of them to repack.
+    """
+    repack_min = 1000
+    repack_ratio = 0.05
+
+    def __init__(self, pairs):
+        self.pack(np.array(pairs, dtype=np.int64).reshape(-1, 2))
+
+    def pack(self, pairs):
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self.recipe_ids, starts = np.unique(pairs[:, 0], return_index=True)
+        self.indptr = np.append(starts, len(pairs))
+        self.ingredients = pairs[:, 1]
+        self.overrides = {}
+
+    def replace_rows(self, rows):
+        """rows: {recipe id: ingredient ids}, empty for a deleted recipe"""
+        for recipe_id, ingredient_ids in rows.items():
+            self.overrides[recipe_id] = frozenset(ingredient_ids)
+        if len(self.overrides) > max(self.repack_min, self.repack_ratio * len(self.recipe_ids)):
+            self.repack()
+
+    def repack(self):
+        sizes = np.diff(self.indptr)
+        keep = np.repeat(~np.isin(self.recipe_ids, list(self.overrides)), sizes)
+        base = np.column_stack((np.repeat(self.recipe_ids, sizes)[keep], self.ingredients[keep]))
+        changed = np.array(
+            [(recipe_id, pk) for recipe_id, ids in self.overrides.items() for pk in ids],
+            dtype=np.int64
+        ).reshape(-1, 2)
+        self.pack(np.concatenate((base, changed)))
+
+    def match(self, pantry, limit, max_missing=None):
+        """[(recipe id, matched, missing)] of recipes using at least one
+        pantry ingredient: fully cookable first, then fewest missing, then
+        most matched"""
+        recipe_ids, matched, missing = np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        if len(self.recipe_ids):
+            have = np.isin(self.ingredients, np.fromiter(pantry, np.int64, len(pantry)))
+            matched = np.add.reduceat(have.astype(np.int64), self.indptr[:-1])
+            missing = np.diff(self.indptr) - matched
+            keep = matched > 0
+            if self.overrides:
+                keep &= ~np.isin(self.recipe_ids, list(self.overrides))
+            recipe_ids, matched, missing = self.recipe_ids[keep], matched[keep], missing[keep]
+
+        extra = [
+            (recipe_id, len(ids & pantry), len(ids - pantry))
+            for recipe_id, ids in self.overrides.items() if ids & pantry
+        ]
+        if extra:
+            columns = np.array(extra, dtype=np.int64)
+            recipe_ids = np.concatenate((recipe_ids, columns[:, 0]))
+            matched = np.concatenate((matched, columns[:, 1]))
+            missing = np.concatenate((missing, columns[:, 2]))
+
+        if max_missing is not None:
+            keep = missing <= max_missing
+            recipe_ids, matched, missing = recipe_ids[keep], matched[keep], missing[keep]
+        order = np.lexsort((recipe_ids, -matched, missing))[:limit]
+        return list(zip(recipe_ids[order].tolist(), matched[order].tolist(), missing[order].tolist()))
+
+
+def build_matrix(user_id):
+    return PantryMatrix(list(
+        IngredientLinks.objects.filter(recipe__user_id=user_id).values_list('recipe_id', 'ingredient_id')
+    ))
+
+
+def get_matrix(user_id):
+    return user_indexes.get(KIND, user_id, build_matrix, scope=KIND)
+
+
+def refresh_rows(user_id, recipe_ids, from_version, to_version, deleted):
+    # only worth a query when this process holds the matrix the change
+    # applies to; anything else gets rebuilt on its next use
+    if user_indexes.version_of(KIND, user_id) != from_version:
+        return
+    rows = {recipe_id: set() for recipe_id in recipe_ids}
+    if not deleted:
+        links = IngredientLinks.objects.filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in links:
+            rows[recipe_id].add(ingredient_id)
+    user_indexes.apply(KIND, user_id, from_version, to_version, lambda matrix: matrix.replace_rows(rows))
+
+
+def links_changed(user_id, recipe_ids, deleted=False):
+    recipe_ids = list(recipe_ids)
+
+    def refresh(version, committed_version):
+        # patched only when no other write bumped the version meanwhile
+        if recipe_ids and committed_version == version + 1:
+            refresh_rows(user_id, recipe_ids, version - 1, committed_version, deleted)
+
+    bump_data_version_on_commit(user_id, scope=KIND, on_commit=refresh)
+
+
+@receiver(m2m_changed, sender=IngredientLinks)
+def update_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            links_changed(instance.user_id, [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        links_changed(instance.user_id, pk_set)
+    elif action == 'pre_clear':
+        links_changed(instance.user_id, instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def update_on_ingredient_delete(sender, instance, **kwargs):
+    links_changed(instance.user_id, instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def update_on_recipe_delete(sender, instance, **kwargs):
+    links_changed(instance.user_id, [instance.pk], deleted=True)
+
+
+@receiver(recipes_bulk_changed)
+def update_on_bulk_change(sender, user_id, recipe_ids, **kwargs):
+    links_changed(user_id, recipe_ids)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_on_user_created(sender, instance, created, **kwargs):
+    if created:
+        bump_data_version(instance.pk, scope=KIND)
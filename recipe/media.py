@@ -0,0 +1,143 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+from PIL import Image, UnidentifiedImageError
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+from rest_framework.negotiation import BaseContentNegotiation
+
+from core.models import Recipe
+from recipe import images
+
+VARIANT_PATH = re.compile(r'^(?P<stem>.+)/(?P<width>\d+)w\.(?P<fmt>\w+)$')
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'private, max-age=31536000, immutable'
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    """the file is what it is whatever the client accepts (an <img> sends
+    Accept: image/*); errors are rendered by the first renderer"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class RangeFile:
+    """file-like view of [start, start + length) of an open file; having no
+    fileno() it is streamed in blocks rather than sent whole by sendfile"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def resolve(user, name):
+    """the stored name to serve for a media path the user may see, creating
+    a missing variant on first use; None when the user owns no recipe
+    showing it"""
+    # only names stored on the user's recipes (or derived from them) match,
+    # so no path built from the URL ever reaches the filesystem
+    recipes = Recipe.objects.filter(user=user)
+    if recipes.filter(image=name).exists():
+        return name
+
+    match = VARIANT_PATH.match(name)
+    if not match:
+        return None
+    width, fmt = int(match['width']), match['fmt']
+    if width not in images.variant_widths() or fmt not in images.variant_formats():
+        return None
+    source = recipes.filter(
+        image__startswith=match['stem'] + '.'
+    ).values_list('image', flat=True).first()
+    if source is None:
+        return None
+    try:
+        return images.ensure_variant(source, width, fmt)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        # source file gone or unreadable: nothing to serve
+        return None
+
+
+def strong_etag(name, stat):
+    # names never get new content (content addressed, or uuid based for
+    # older uploads), mtime/size still guard against a file regenerated
+    return '"%s"' % hashlib.md5(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()
+
+
+def parse_range(header, size):
+    """(start, length) for a single satisfiable byte range, 'unsatisfiable',
+    or None to send the whole file (no Range, or one we choose to ignore)"""
+    match = BYTE_RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = min(int(last), size)
+        return (size - length, length) if length else 'unsatisfiable'
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end - start + 1
+
+
+def serve(request, name):
+    path = default_storage.path(name)
+    stat = os.stat(path)
+    etag = strong_etag(name, stat)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    elif getattr(settings, 'RECIPE_MEDIA_X_ACCEL_PREFIX', None):
+        # nginx streams the file from an internal location and does Range itself
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.RECIPE_MEDIA_X_ACCEL_PREFIX + name
+    elif getattr(settings, 'RECIPE_MEDIA_X_SENDFILE', False):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        if request.META.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(request.META.get('HTTP_RANGE', ''), stat.st_size)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, length = byte_range
+            response = FileResponse(RangeFile(open(path, 'rb'), start, length),
+                                    status=206, content_type=content_type)
+            response['Content-Length'] = length
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+        else:
+            # a real file object, so the server can use sendfile
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE
+    response['Accept-Ranges'] = 'bytes'
+    return response
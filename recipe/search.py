@@ -0,0 +1,139 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+from rest_framework.filters import OrderingFilter
+
+from core.models import SEARCH_CONFIG, Recipe
+from recipe.indexes import user_indexes
+
+TOKEN = re.compile(r'\w+')
+# same proportions as Postgres' default weights for A (title) and B (names)
+TITLE_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+# pg_trgm's default similarity threshold
+TRIGRAM_THRESHOLD = 0.3
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def trigrams(token):
+    # padded like pg_trgm: two spaces in front, one behind
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """token -> {recipe id: weight} postings over title and tag/ingredient
+    names of one user's recipes; terms missing from the vocabulary fall
+    back to its trigram-similar tokens, so typos still match"""
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        for pk, title, text in rows:
+            for weight, value in ((TITLE_WEIGHT, title), (TEXT_WEIGHT, text)):
+                for token in tokenize(value):
+                    postings = self.postings[token]
+                    postings[pk] = postings.get(pk, 0) + weight
+        self._trigram_index = None
+
+    def similar_tokens(self, term):
+        if self._trigram_index is None:
+            self._trigram_index = defaultdict(set)
+            for token in self.postings:
+                for gram in trigrams(token):
+                    self._trigram_index[gram].add(token)
+        wanted = trigrams(term)
+        candidates = set().union(*(self._trigram_index.get(gram, ()) for gram in wanted))
+        for token in candidates:
+            grams = trigrams(token)
+            similarity = len(wanted & grams) / len(wanted | grams)
+            if similarity >= TRIGRAM_THRESHOLD:
+                yield token, similarity
+
+    def term_scores(self, term):
+        if term in self.postings:
+            return self.postings[term]
+        scores = {}
+        for token, similarity in self.similar_tokens(term):
+            for pk, weight in self.postings[token].items():
+                scores[pk] = max(scores.get(pk, 0), weight * similarity)
+        return scores
+
+    def search(self, query, limit):
+        """[(recipe id, score)] of recipes matching every term, best first"""
+        scores = None
+        for term in set(tokenize(query)):
+            matched = self.term_scores(term)
+            if scores is None:
+                scores = dict(matched)
+            else:
+                scores = {pk: score + matched[pk] for pk, score in scores.items() if pk in matched}
+            if not scores:
+                return []
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+def build_index(user_id):
+    return InvertedIndex(Recipe.objects.filter(user_id=user_id).values_list('id', 'title', 'search_text'))
+
+
+def max_results():
+    return getattr(settings, 'RECIPE_SEARCH_MAX_RESULTS', 500)
+
+
+def no_matches(queryset):
+    # still annotated: the ranked default ordering refers to search_rank
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def rank_from_index(queryset, user_id, query):
+    """annotate search_rank from the in-process index and drop non-matches;
+    ids are grouped by (rounded) score to keep the CASE short"""
+    ids_by_score = defaultdict(list)
+    for pk, score in user_indexes.get('search', user_id, build_index).search(query, max_results()):
+        ids_by_score[round(score, 3)].append(pk)
+    if not ids_by_score:
+        return no_matches(queryset)
+    rank = Case(
+        *[When(id__in=ids, then=Value(score)) for score, ids in ids_by_score.items()],
+        output_field=FloatField()
+    )
+    return queryset.annotate(search_rank=rank).filter(search_rank__isnull=False)
+
+
+def search_recipes(queryset, user_id, query):
+    if not tokenize(query):
+        return no_matches(queryset)
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        ranked = queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+        if ranked.exists():
+            return ranked
+        # nothing matched the stemmed terms: try the typo tolerant index
+    return rank_from_index(queryset, user_id, query)
+
+
+class RecipeSearchFilter(OrderingFilter):
+    """?search= ranked full-text search over title, tag and ingredient
+    names; matches come best first unless ?ordering= is given"""
+    search_param = 'search'
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get(self.search_param, '').strip():
+            return ('-search_rank', 'id')
+        return super().get_default_ordering(view)
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if query:
+            queryset = search_recipes(queryset, request.user.pk, query)
+        return super().filter_queryset(request, queryset, view)
@@ -1,11 +1,99 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from core.models import Tag, Ingredient, Recipe
+from rest_framework.relations import MANY_RELATION_KWARGS
+from django.core.files.storage import default_storage
+from core.models import Tag, Ingredient, Recipe, RecipeImageJob, RecipeImageUpload
+from recipe import images, uploads
 
 
-class TagSerializer(serializers.ModelSerializer):
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """resolves every submitted pk with a single id__in query instead of
+    one query per pk, reporting each bad pk on its own"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pk_field = child.get_queryset().model._meta.pk
+        errors, pks = [], []
+        for value in data:
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                pks.append(pk_field.to_python(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                errors.append(child.error_messages['incorrect_type'].format(data_type=type(value).__name__))
+
+        found = child.get_queryset().in_bulk(pks) if pks else {}
+        errors.extend(
+            child.error_messages['does_not_exist'].format(pk_value=pk)
+            for pk in pks if pk not in found
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [found[pk] for pk in dict.fromkeys(pks)]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """pk field only accepting objects owned by the requesting user"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        queryset = super().get_queryset()
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the width bounded variants of an image, for srcset"""
+
+    def to_representation(self, value):
+        if not value:
+            return []
+        request = self.context.get('request')
+        variants = []
+        for fmt in images.variant_formats():
+            for width in images.variant_widths():
+                url = default_storage.url(images.variant_name(value.name, width, fmt))
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants.append({'width': width, 'format': fmt, 'url': url})
+        return variants
+
+
+class RecipeAttrSerializer(serializers.ModelSerializer):
+    """tag or ingredient; a name is unique per user ignoring case"""
+
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is None:
+            return value
+        others = self.Meta.model.objects.filter(user=request.user, name__iexact=value)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError(
+                f'{self.Meta.model._meta.verbose_name} with this name already exists.'
+            )
+        return value
+
+
+class TagSerializer(RecipeAttrSerializer):
     class Meta:
         model = Tag
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'recipe_count')
         extra_kwargs = {
             'id': {
                 'read_only': True
@@ -13,37 +101,152 @@ class TagSerializer(serializers.ModelSerializer):
         }
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecipeAttrSerializer):
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+
 
+class SparseFieldsMixin:
+    """keeps only the fields named in context['fields'] (None keeps all but
+    opt_in_fields, returned only when named) and turns the id lists named
+    in context['expand'] into nested objects, using expand_serializers"""
+    expand_serializers = {}
+    opt_in_fields = ()
 
-class RecipeSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        dropped = set(self.opt_in_fields) if fields is None else set(self.fields) - set(fields)
+        for name in dropped & set(self.fields):
+            self.fields.pop(name)
+        for name in self.context.get('expand', ()):
+            if name in self.fields:
+                self.fields[name] = self.expand_serializers[name](many=True, read_only=True)
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expand_serializers = {'tags': TagSerializer, 'ingredients': IngredientSerializer}
+    # a dozen URLs per row, so list pages carry them only on ?fields=
+    opt_in_fields = ('image_variants',)
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'title', 'price', 'time_minutes', 'link', 'image', 'tags', 'ingredients')
+        fields = ('id', 'title', 'price', 'time_minutes', 'link', 'image', 'image_variants', 'tags', 'ingredients')
         read_only_fields = ('id', 'image')
 
 
 class RecipeDetailSerializer(RecipeSerializer):
+    opt_in_fields = ()
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
 
+class RecipeImageJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeImageJob
+        fields = ('id', 'status', 'error', 'created_at', 'updated_at')
+        read_only_fields = fields
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+    image_job = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants', 'image_job')
+        read_only_fields = ('id', 'image')
+
+    def get_image_job(self, recipe):
+        job = recipe.image_jobs.order_by('-id').first()
+        return RecipeImageJobSerializer(job).data if job else None
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    """accepts the raw upload; decoding is left to the image worker"""
+    image = serializers.FileField()
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    """a resumable upload; PUT chunks with Content-Range until offset == size"""
+    filename = serializers.CharField(write_only=True, required=False, default='', max_length=255)
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = ('id', 'size', 'offset', 'filename')
+        read_only_fields = ('id', 'offset')
+        extra_kwargs = {'size': {'min_value': 1}}
+
+    def validate_size(self, value):
+        if value > uploads.max_upload_size():
+            raise serializers.ValidationError(f'Uploads are limited to {uploads.max_upload_size()} bytes.')
+        return value
+
+
+class ChunkedUploadCompleteSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+
+
+class RecipeMatchSerializer(serializers.Serializer):
+    """the ingredient ids at hand; recipes are ranked by how few they miss"""
+    ingredients = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class AttrNamesSerializer(serializers.Serializer):
+    """names to look up or create in one request of tags/upsert/ or
+    ingredients/upsert/"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255), allow_empty=False, max_length=1000
+    )
+
+
+class RecipeBulkItemSerializer(serializers.ModelSerializer):
+    """one recipe of a bulk write; tag and ingredient ids are checked for the
+    whole batch at once by recipe.bulk"""
+    tags = serializers.ListField(child=serializers.IntegerField(), required=False)
+    ingredients = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'title', 'price', 'time_minutes', 'link', 'tags', 'ingredients')
         read_only_fields = ('id',)
+
+
+class PriceStatsSerializer(serializers.Serializer):
+    avg = serializers.DecimalField(max_digits=14, decimal_places=2)
+    min = serializers.DecimalField(max_digits=5, decimal_places=2)
+    max = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+class TimeStatsSerializer(serializers.Serializer):
+    avg = serializers.FloatField()
+    min = serializers.IntegerField()
+    max = serializers.IntegerField()
+
+
+class AttrUsageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """read only view of recipe.stats.get_stats()"""
+    recipe_count = serializers.IntegerField()
+    price = PriceStatsSerializer()
+    time_minutes = TimeStatsSerializer()
+    tags = AttrUsageSerializer(many=True)
+    ingredients = AttrUsageSerializer(many=True)
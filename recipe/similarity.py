@@ -0,0 +1,98 @@
+import hashlib
+from collections import defaultdict
+import numpy as np
+from django.dispatch import receiver
+
+from core.models import (RECIPE_ATTR_FIELDS, Recipe, RecipeSignature, RecipeSimilarityBucket, insert_rows,
+                         recipe_links_changed, recipes_bulk_changed)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# a Mersenne prime above every feature id; a * x + b stays inside int64
+PRIME = (1 << 31) - 1
+# fixed seed: signatures stored by one process are compared by every other
+_rng = np.random.default_rng(20190)
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.int64)
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.int64)
+
+
+def feature_sets(recipe_ids, exclude=None):
+    """{recipe id: feature ids} over tags (even) and ingredients (odd)"""
+    features = defaultdict(list)
+    for offset, (model, field_name) in enumerate(RECIPE_ATTR_FIELDS.items()):
+        field = Recipe._meta.get_field(field_name)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects.filter(recipe_id__in=recipe_ids)
+        if isinstance(exclude, model):
+            links = links.exclude(**{target: exclude.pk})
+        for recipe_id, pk in links.values_list('recipe_id', target):
+            features[recipe_id].append(pk * 2 + offset)
+    return features
+
+
+def minhash(features):
+    values = np.array(features, dtype=np.int64) % PRIME
+    return ((PERM_A[:, None] * values[None, :] + PERM_B[:, None]) % PRIME).min(axis=1).astype(np.int32)
+
+
+def band_buckets(signature):
+    for band in range(BANDS):
+        digest = hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'big', signed=True)
+
+
+def index_recipes(user_ids_by_recipe, features):
+    """write signatures and buckets of recipes whose old entries are gone"""
+    signatures, buckets = [], []
+    for recipe_id, user_id in user_ids_by_recipe.items():
+        if not features.get(recipe_id):
+            continue
+        signature = minhash(features[recipe_id])
+        signatures.append((recipe_id, signature.tobytes()))
+        buckets.extend((user_id, recipe_id, band, bucket) for band, bucket in band_buckets(signature))
+    # sixteen bucket rows per recipe: they go straight to executemany
+    if signatures:
+        insert_rows(RecipeSignature, ['recipe', 'signature'], signatures)
+        insert_rows(RecipeSimilarityBucket, ['user', 'recipe', 'band', 'bucket'], buckets)
+    return len(signatures)
+
+
+def update_recipes(recipe_ids, exclude=None):
+    user_ids_by_recipe = dict(Recipe.objects.filter(id__in=recipe_ids).values_list('id', 'user_id'))
+    RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeSimilarityBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+    return index_recipes(user_ids_by_recipe, feature_sets(recipe_ids, exclude))
+
+
+def similar_recipes(recipe, k):
+    """[(recipe id, estimated Jaccard similarity)] of the k most similar
+    recipes among those sharing an LSH bucket with recipe"""
+    try:
+        signature = np.frombuffer(bytes(recipe.signature.signature), dtype=np.int32)
+    except RecipeSignature.DoesNotExist:
+        return []
+    bands = set(band_buckets(signature))
+    # one index range per bucket value; the band is checked on the way out
+    hits = RecipeSimilarityBucket.objects.filter(
+        user_id=recipe.user_id, bucket__in=[bucket for _, bucket in bands]
+    ).values_list('recipe_id', 'band', 'bucket')
+    candidates = {pk for pk, band, bucket in hits if (band, bucket) in bands and pk != recipe.pk}
+    if not candidates:
+        return []
+    rows = list(RecipeSignature.objects.filter(recipe_id__in=candidates).values_list('recipe_id', 'signature'))
+    ids = np.array([pk for pk, _ in rows], dtype=np.int64)
+    matrix = np.frombuffer(b''.join(bytes(sig) for _, sig in rows), dtype=np.int32).reshape(len(rows), NUM_PERM)
+    similarity = (matrix == signature).mean(axis=1)
+    order = np.lexsort((ids, -similarity))[:k]
+    return [(int(ids[i]), round(float(similarity[i]), 3)) for i in order]
+
+
+@receiver(recipe_links_changed)
+def update_on_links_changed(sender, recipe_ids, exclude=None, **kwargs):
+    update_recipes(recipe_ids, exclude)
+
+
+@receiver(recipes_bulk_changed)
+def update_on_bulk_change(sender, recipe_ids, **kwargs):
+    update_recipes(recipe_ids)
@@ -0,0 +1,166 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import RECIPE_ATTR_FIELDS, Recipe, RecipeStats, recipes_bulk_changed
+
+ROLLUP_FIELDS = ('price', 'time_minutes')
+
+
+def recipe_values(recipe):
+    """(price, time_minutes) of an instance as the database stores them"""
+    return tuple(Recipe._meta.get_field(name).to_python(getattr(recipe, name)) for name in ROLLUP_FIELDS)
+
+
+def compute(user_ids):
+    """{user id: rollup fields} straight from the recipes"""
+    empty = dict(recipe_count=0, price_total=Decimal('0.00'), time_minutes_total=0)
+    for name in ROLLUP_FIELDS:
+        empty.update({f'{name}_min': None, f'{name}_max': None})
+    results = {pk: dict(empty) for pk in user_ids}
+
+    aggregates = {}
+    for name in ROLLUP_FIELDS:
+        aggregates.update({f'{name}_total': Sum(name), f'{name}_min': Min(name), f'{name}_max': Max(name)})
+    rows = Recipe.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+        recipe_count=Count('id'), **aggregates
+    )
+    for row in rows:
+        results[row.pop('user_id')].update(row)
+    return results
+
+
+def stored(user_ids):
+    """the rollups as kept, same shape as compute(); users without one are left out"""
+    fields = [field.name for field in RecipeStats._meta.concrete_fields if field.name != 'user']
+    return {
+        row.pop('user_id'): row
+        for row in RecipeStats.objects.filter(user_id__in=user_ids).values('user_id', *fields)
+    }
+
+
+def drifted(user_ids):
+    """ids of the users whose rollup no longer matches their recipes"""
+    current = stored(user_ids)
+    expected = compute(list(current))
+    return sorted(pk for pk in current if current[pk] != expected[pk])
+
+
+def rebuild(user_ids):
+    """replace the rollups of user_ids with ones computed from scratch"""
+    with transaction.atomic():
+        # serializes concurrent rebuilds of the same user
+        list(get_user_model().objects.select_for_update().filter(pk__in=user_ids).values_list('pk'))
+        computed = compute(user_ids)
+        RecipeStats.objects.filter(user_id__in=user_ids).delete()
+        RecipeStats.objects.bulk_create([RecipeStats(user_id=pk, **rollup) for pk, rollup in computed.items()])
+
+
+def apply_change(user_id, added=(), removed=()):
+    """fold recipes entering (added) and leaving (removed) the user's set,
+    as (price, time_minutes) pairs, into the rollup once the rows are written"""
+    with transaction.atomic():
+        rollup = RecipeStats.objects.select_for_update().filter(user_id=user_id).first()
+        if rollup is None:
+            # built from scratch on first read
+            return
+        rollup.recipe_count += len(added) - len(removed)
+        stale = []
+        for index, name in enumerate(ROLLUP_FIELDS):
+            new = [values[index] for values in added]
+            old = [values[index] for values in removed]
+            setattr(rollup, f'{name}_total', getattr(rollup, f'{name}_total') + sum(new) - sum(old))
+            low, high = getattr(rollup, f'{name}_min'), getattr(rollup, f'{name}_max')
+            if old and (low is None or min(old) <= low or max(old) >= high):
+                # the extreme itself may be gone, only the recipes can tell
+                stale.append(name)
+            elif new:
+                setattr(rollup, f'{name}_min', min(new) if low is None else min(low, *new))
+                setattr(rollup, f'{name}_max', max(new) if high is None else max(high, *new))
+        if stale:
+            aggregates = {}
+            for name in stale:
+                aggregates.update({f'{name}_min': Min(name), f'{name}_max': Max(name)})
+            for key, value in Recipe.objects.filter(user_id=user_id).aggregate(**aggregates).items():
+                setattr(rollup, key, value)
+        rollup.save()
+
+
+def usage_list(user_id, model):
+    # served by the (user, -recipe_count, id) index
+    return list(
+        model.objects.filter(user_id=user_id).order_by('-recipe_count', 'id')
+        .values('id', 'name', 'recipe_count')
+    )
+
+
+def get_stats(user_id):
+    rollup = RecipeStats.objects.filter(user_id=user_id).first()
+    if rollup is None:
+        rebuild([user_id])
+        rollup = RecipeStats.objects.get(user_id=user_id)
+    count = rollup.recipe_count
+    data = {'recipe_count': count}
+    for name in ROLLUP_FIELDS:
+        data[name] = {
+            'avg': getattr(rollup, f'{name}_total') / count if count else None,
+            'min': getattr(rollup, f'{name}_min'),
+            'max': getattr(rollup, f'{name}_max'),
+        }
+    for model, field_name in RECIPE_ATTR_FIELDS.items():
+        data[field_name] = usage_list(user_id, model)
+    return data
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_rollup_values(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and not set(update_fields) & set(ROLLUP_FIELDS)):
+        return
+    instance._rollup_values = Recipe.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_on_save(sender, instance, created, **kwargs):
+    before = instance.__dict__.pop('_rollup_values', None)
+    values = recipe_values(instance)
+    if created:
+        apply_change(instance.user_id, added=[values])
+    elif before is not None and before != values:
+        apply_change(instance.user_id, added=[values], removed=[before])
+
+
+@receiver(post_delete, sender=Recipe)
+def update_on_delete(sender, instance, **kwargs):
+    apply_change(instance.user_id, removed=[recipe_values(instance)])
+
+
+@receiver(recipes_bulk_changed)
+def update_on_bulk_change(sender, user_id, recipe_ids, created=False, previous=None, **kwargs):
+    if created:
+        apply_change(user_id, added=list(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(*ROLLUP_FIELDS)
+        ))
+    elif previous is not None:
+        # recipes whose rollup fields moved leave with their old values and
+        # come back with the new ones
+        changed = {pk: values for pk, values in previous.items() if set(values) & set(ROLLUP_FIELDS)}
+        if changed:
+            current = {
+                pk: values for pk, *values in
+                Recipe.objects.filter(id__in=changed).values_list('id', *ROLLUP_FIELDS)
+            }
+            removed = [
+                tuple(
+                    Recipe._meta.get_field(name).to_python(changed[pk].get(name, current[pk][index]))
+                    for index, name in enumerate(ROLLUP_FIELDS)
+                )
+                for pk in current
+            ]
+            apply_change(user_id, added=[tuple(values) for values in current.values()], removed=removed)
+    elif RecipeStats.objects.filter(user_id=user_id).exists():
+        # no before values to fold out
+        rebuild([user_id])
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """stores every file under the sha256 of its content, sharded into nested
+    hash prefix directories; saving bytes that are already stored is a no-op
+    returning the existing name"""
+
+    def __init__(self, prefix='uploads/recipe/', depth=2, width=2, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.depth = depth
+        self.width = width
+
+    def hashed_name(self, digest, ext):
+        shards = [digest[i * self.width:(i + 1) * self.width] for i in range(self.depth)]
+        return os.path.join(self.prefix, *shards, digest + ext)
+
+    def save(self, name, content, max_length=None):
+        ext = os.path.splitext(name)[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        # hash while streaming to a temp file on the same filesystem, so the
+        # content is never held in memory and the final move is atomic
+        with tempfile.NamedTemporaryFile(dir=self.location, delete=False) as tmp:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks():
+                digest.update(chunk)
+                tmp.write(chunk)
+        name = self.hashed_name(digest.hexdigest(), ext)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.unlink(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name.replace('\\', '/')
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Tag
+from recipe import autocomplete
+from recipe.indexes import user_indexes
+
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+
+
+def names(res):
+    return [item['name'] for item in res.data]
+
+
+class AutocompleteApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='complete@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        for name in ('Tomato', 'tofu', 'Tomatillo', 'salt', 'toast'):
+            Ingredient.objects.create(user=self.user, name=name)
+
+    def test_case_insensitive_prefix_matches_in_order(self):
+        res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'TO'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(names(res), ['toast', 'tofu', 'Tomatillo', 'Tomato'])
+
+    def test_limit(self):
+        res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'tom', 'limit': 1})
+
+        self.assertEqual(names(res), ['Tomatillo'])
+
+    def test_no_queries_once_index_is_built(self):
+        self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 't'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'sa'})
+        self.assertEqual(names(res), ['salt'])
+
+    def test_index_follows_creates_and_deletes(self):
+        self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 't'})
+        self.client.post(reverse('recipe:ingredient-list'), {'name': 'Tarragon'})
+        Ingredient.objects.get(name='toast').delete()
+
+        res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, {'q': 't'})
+
+        self.assertEqual(names(res), ['Tarragon', 'tofu', 'Tomatillo', 'Tomato'])
+
+    def test_tags_and_users_kept_apart(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass123')
+        Tag.objects.create(user=other, name='toddler')
+        Tag.objects.create(user=self.user, name='tonight')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'to'})
+
+        self.assertEqual(names(res), ['tonight'])
+
+
+class AutocompleteIndexUpdateTest(TransactionTestCase):
+    """in-place updates happen on commit"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('complete@gmail.com', 'testpass123')
+        Ingredient.objects.create(user=self.user, name='salt')
+
+    def test_loaded_index_patched_instead_of_rebuilt(self):
+        index = autocomplete.get_index(Ingredient, self.user.pk)
+        pepper = Ingredient.objects.create(user=self.user, name='pepper')
+        Ingredient.objects.filter(name='salt').delete()
+        Ingredient.objects.get(name='pepper').delete()
+        Ingredient.objects.create(user=self.user, name='Paprika')
+
+        with self.assertNumQueries(0):
+            current = autocomplete.get_index(Ingredient, self.user.pk)
+        self.assertIs(current, index)
+        self.assertEqual([item['name'] for item in current.search('p', 10)], ['Paprika'])
+        self.assertNotIn(pepper.pk, current.names)
+
+    def test_index_built_before_commit_not_kept(self):
+        with transaction.atomic():
+            Ingredient.objects.create(user=self.user, name='pepper')
+            # stands in for a concurrent request, loading the index at the
+            # version bumped by the uncommitted write
+            during = autocomplete.get_index(Ingredient, self.user.pk)
+
+        self.assertIsNot(autocomplete.get_index(Ingredient, self.user.pk), during)
+
+    def tearDown(self):
+        user_indexes.clear()
@@ -0,0 +1,153 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ChangeLogEntry, ChangeLogWriter, Recipe, Tag
+from recipe.views import ChangeFeedView
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class PublicChangeFeedTest(TestCase):
+    def test_login_required(self):
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangeFeedTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='sync@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_cursor(self):
+        return self.client.get(CHANGES_URL).data['cursor']
+
+    def test_changes_since_cursor(self):
+        sample_recipe(self.user, title='before')
+        cursor = self.get_cursor()
+        recipe = sample_recipe(self.user, title='after')
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        recipe.tags.add(tag)
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['title'] for r in res.data['recipes']], ['after'])
+        self.assertEqual(res.data['recipes'][0]['tags'], [tag.id])
+        self.assertEqual([t['id'] for t in res.data['tags']], [tag.id])
+        self.assertFalse(res.data['has_more'])
+
+    def test_urls_absolute(self):
+        cursor = self.get_cursor()
+        recipe = sample_recipe(self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(image='uploads/recipe/soup.jpg')
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertTrue(res.data['recipes'][0]['image'].startswith('http://testserver/'))
+
+    def test_deleted_objects_tombstoned(self):
+        recipe = sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        cursor = self.get_cursor()
+        recipe_id, tag_id = recipe.id, tag.id
+        recipe.delete()
+        tag.delete()
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.data['recipes'], [])
+        self.assertEqual(res.data['deleted']['recipes'], [recipe_id])
+        self.assertEqual(res.data['deleted']['tags'], [tag_id])
+
+    def test_cursor_advances(self):
+        cursor = self.get_cursor()
+        sample_recipe(self.user)
+        cursor = self.client.get(CHANGES_URL, {'since': cursor}).data['cursor']
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.data['recipes'], [])
+
+    def test_other_users_changes_hidden(self):
+        other = get_user_model().objects.create_user(
+            email='other@gmail.com',
+            password='testpass123'
+        )
+        cursor = self.get_cursor()
+        sample_recipe(other)
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.data['recipes'], [])
+        self.assertEqual(res.data['deleted']['recipes'], [])
+
+    def test_log_writes_serialized_per_user(self):
+        with patch.object(ChangeLogEntry, 'lock_writers', wraps=ChangeLogEntry.lock_writers) as lock:
+            recipe = sample_recipe(self.user)
+            recipe.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+
+        self.assertTrue(lock.call_args_list)
+        self.assertTrue(all(list(call[0][0]) == [self.user.pk] for call in lock.call_args_list))
+
+    def test_log_writes_lock_writer_row_not_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            ChangeLogEntry.lock_writers([self.user.pk])
+
+        self.assertTrue(ChangeLogWriter.objects.filter(user=self.user).exists())
+        self.assertFalse(any('core_user' in query['sql'] for query in queries))
+
+    def test_expired_cursor_gone(self):
+        with patch('django.utils.timezone.now', return_value=timezone.now() - timedelta(days=365)):
+            cursor = self.get_cursor()
+
+        res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_compacted_between_pages_gone(self):
+        started = timezone.now() - timedelta(days=29)
+        with patch('django.utils.timezone.now', return_value=started):
+            cursor = self.get_cursor()
+            for title in ('first', 'second', 'third'):
+                sample_recipe(self.user, title=title)
+        with patch.object(ChangeFeedView, 'page_size', 1):
+            cursor = self.client.get(CHANGES_URL, {'since': cursor}).data['cursor']
+
+            with patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+                call_command('compact_change_log', stdout=StringIO())
+                res = self.client.get(CHANGES_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_invalid_cursor(self):
+        res = self.client.get(CHANGES_URL, {'since': 'nope'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,237 @@
+import base64
+import hashlib
+import io
+import uuid
+from datetime import timedelta
+from io import StringIO
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeImageJob, RecipeImageUpload
+from recipe import images, uploads
+
+
+def start_url(recipe_id):
+    return reverse('recipe:recipe-start-image-upload', args=[recipe_id])
+
+
+def chunk_url(recipe_id, upload_id):
+    return reverse('recipe:recipe-image-upload', args=[recipe_id, upload_id])
+
+
+def complete_url(recipe_id, upload_id):
+    return reverse('recipe:recipe-complete-image-upload', args=[recipe_id, upload_id])
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+def sample_image_bytes():
+    out = io.BytesIO()
+    Image.new('RGB', (200, 100), 'green').save(out, format='PNG')
+    return out.getvalue()
+
+
+class ChunkedUploadApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+        self.data = sample_image_bytes()
+
+    def tearDown(self):
+        for upload in RecipeImageUpload.objects.all():
+            default_storage.delete(upload.staged_file)
+        for job in RecipeImageJob.objects.all():
+            default_storage.delete(job.staged_file)
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            images.delete_image(self.recipe.image.name)
+
+    def start(self, size=None):
+        res = self.client.post(start_url(self.recipe.id), {'size': size or len(self.data), 'filename': 'a.png'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def put_chunk(self, upload_id, start, end, **headers):
+        return self.client.put(
+            chunk_url(self.recipe.id, upload_id),
+            self.data[start:end],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}',
+            **headers
+        )
+
+    def test_upload_in_chunks_and_complete(self):
+        upload_id = self.start()
+        half = len(self.data) // 2
+
+        res = self.put_chunk(upload_id, 0, half)
+        self.assertEqual(res.data['offset'], half)
+        res = self.put_chunk(upload_id, half, len(self.data))
+        self.assertEqual(res.data['offset'], len(self.data))
+
+        res = self.client.post(complete_url(self.recipe.id, upload_id),
+                               {'sha256': hashlib.sha256(self.data).hexdigest()})
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['image_job']['status'], RecipeImageJob.PENDING)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+
+        call_command('process_image_jobs', '--once', '--workers', '1', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+
+    def test_resume_after_failed_chunk(self):
+        upload_id = self.start()
+        half = len(self.data) // 2
+        self.put_chunk(upload_id, 0, half)
+
+        bad_digest = 'sha-256=' + base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+        res = self.put_chunk(upload_id, half, len(self.data), HTTP_DIGEST=bad_digest)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(chunk_url(self.recipe.id, upload_id))
+        self.assertEqual(res.data['offset'], half)
+
+        digest = 'sha-256=' + base64.b64encode(hashlib.sha256(self.data[half:]).digest()).decode()
+        res = self.put_chunk(upload_id, half, len(self.data), HTTP_DIGEST=digest)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with default_storage.open(RecipeImageUpload.objects.get().staged_file) as staged:
+            self.assertEqual(staged.read(), self.data)
+
+    def test_chunk_at_wrong_offset_conflicts(self):
+        upload_id = self.start()
+        res = self.put_chunk(upload_id, 10, 20)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunk_in_flight_conflicts(self):
+        upload_id = self.start()
+        RecipeImageUpload.objects.filter(pk=upload_id).update(
+            chunk_claim=uuid.uuid4(), chunk_claimed_until=timezone.now() + timedelta(minutes=1)
+        )
+
+        res = self.put_chunk(upload_id, 0, 10)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(RecipeImageUpload.objects.get().offset, 0)
+
+    def test_lapsed_chunk_claim_taken_over(self):
+        upload_id = self.start()
+        RecipeImageUpload.objects.filter(pk=upload_id).update(
+            chunk_claim=uuid.uuid4(), chunk_claimed_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        res = self.put_chunk(upload_id, 0, 10)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        upload = RecipeImageUpload.objects.get()
+        self.assertEqual(upload.offset, 10)
+        self.assertIsNone(upload.chunk_claim)
+
+    def test_complete_before_all_bytes_conflicts(self):
+        upload_id = self.start()
+        self.put_chunk(upload_id, 0, 10)
+        res = self.client.post(complete_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RecipeImageJob.objects.exists())
+
+    def test_complete_with_wrong_checksum_rejected(self):
+        upload_id = self.start()
+        self.put_chunk(upload_id, 0, len(self.data))
+        res = self.client.post(complete_url(self.recipe.id, upload_id), {'sha256': '0' * 64})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_size_cap_enforced(self):
+        res = self.client.post(start_url(self.recipe.id), {'size': 101})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_past_declared_size_rejected(self):
+        upload_id = self.start(size=10)
+        res = self.client.put(
+            chunk_url(self.recipe.id, upload_id), self.data[:20],
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-19/10'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        res = self.client.put(
+            chunk_url(self.recipe.id, upload_id), self.data[:20],
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-19/20'
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(RecipeImageUpload.objects.get().offset, 0)
+
+    def test_other_users_upload_not_found(self):
+        upload_id = self.start()
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(chunk_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abandoned_uploads_expire(self):
+        upload_id = self.start()
+        upload = RecipeImageUpload.objects.get(pk=upload_id)
+
+        self.assertEqual(uploads.expire_uploads(timedelta(hours=1)), 0)
+        self.assertEqual(uploads.expire_uploads(timedelta(hours=-1)), 1)
+        self.assertFalse(default_storage.exists(upload.staged_file))
+
+
+class ChunkedUploadDeleteTest(TransactionTestCase):
+    """staged files go once the delete commits, so this needs real commits"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def test_staged_file_deleted_with_recipe(self):
+        res = self.client.post(start_url(self.recipe.id), {'size': 100, 'filename': 'a.png'})
+        staged = RecipeImageUpload.objects.get(pk=res.data['id']).staged_file
+
+        self.recipe.delete()
+
+        self.assertFalse(default_storage.exists(staged))
+
+    def test_completed_upload_leaves_file_to_job(self):
+        data = sample_image_bytes()
+        res = self.client.post(start_url(self.recipe.id), {'size': len(data), 'filename': 'a.png'})
+        self.client.put(
+            chunk_url(self.recipe.id, res.data['id']), data,
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE=f'bytes 0-{len(data) - 1}/{len(data)}'
+        )
+        self.client.post(complete_url(self.recipe.id, res.data['id']))
+
+        job = RecipeImageJob.objects.get()
+        self.assertTrue(default_storage.exists(job.staged_file))
+        default_storage.delete(job.staged_file)
@@ -10,6 +10,7 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+INGREDIENTS_UPSERT_URL = reverse('recipe:ingredient-upsert')
 
 
 class PublicIngredientTest(TestCase):
@@ -32,14 +33,14 @@ class PrivateIngredientTest(TestCase):
 
     def test_retrieve_ingredient_list(self):
         Ingredient.objects.create(user=self.user, name='potato')
-        Ingredient.objects.create(user=self.user, name='potato')
-        ingredients = Ingredient.objects.all().order_by('name')
+        Ingredient.objects.create(user=self.user, name='salt')
+        ingredients = Ingredient.objects.all().order_by('id')
 
         ser = IngredientSerializer(ingredients, many=True)
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, ser.data)
+        self.assertEqual(res.data['results'], ser.data)
 
     def test_ingredient_limited_to_user(self):
         user2 = get_user_model().objects.create_user('other@gmail.com', 'other123')
@@ -49,8 +50,8 @@ class PrivateIngredientTest(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
 
     def test_create_ingredient_successful(self):
         payload = {
@@ -67,6 +68,17 @@ class PrivateIngredientTest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_upsert_ingredients(self):
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        get_user_model().objects.create_user('other@gmail.com', 'testpass').ingredient_set.create(name='egg')
+
+        res = self.client.post(INGREDIENTS_UPSERT_URL, {'names': ['Salt', 'egg']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        egg = Ingredient.objects.get(user=self.user, name='egg')
+        self.assertEqual([item['id'] for item in res.data['results']], [salt.id, egg.id])
+        self.assertEqual(egg.recipe_count, 0)
+
     def test_retrieve_ingredients_assigned_to_recipe(self):
         ingredient1 = Ingredient.objects.create(
             name='tomato',
@@ -86,8 +98,32 @@ class PrivateIngredientTest(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
+        ingredient1.refresh_from_db()
         ser1 = IngredientSerializer(ingredient1)
         ser2 = IngredientSerializer(ingredient2)
 
-        self.assertIn(ser1.data, res.data)
-        self.assertNotIn(ser2.data, res.data)
\ No newline at end of file
+        self.assertIn(ser1.data, res.data['results'])
+        self.assertNotIn(ser2.data, res.data['results'])
+
+    def test_retrieve_ingredients_assigned_unique(self):
+        ingredient = Ingredient.objects.create(user=self.user, name='egg')
+        Ingredient.objects.create(user=self.user, name='salt')
+        recipe1 = Recipe.objects.create(
+            title='omelette',
+            price=3.00,
+            time_minutes=5,
+            user=self.user
+        )
+        recipe2 = Recipe.objects.create(
+            title='cake',
+            price=8.00,
+            time_minutes=40,
+            user=self.user
+        )
+        recipe1.ingredients.add(ingredient)
+        recipe2.ingredients.add(ingredient)
+
+        res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
+
+        ingredient.refresh_from_db()
+        self.assertEqual(res.data['results'], [IngredientSerializer(ingredient).data])
@@ -0,0 +1,154 @@
+import io
+from io import StringIO
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe import images
+
+
+def media_url(name):
+    return settings.MEDIA_URL + name
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+def content(res):
+    return b''.join(res.streaming_content)
+
+
+@override_settings(RECIPE_IMAGE_VARIANTS_EAGER=False)
+class MediaApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+        out = io.BytesIO()
+        Image.new('RGB', (800, 400), 'orange').save(out, format='PNG')
+        out.seek(0)
+        out.name = 'a.png'
+        self.client.post(reverse('recipe:recipe-upload-image', args=[self.recipe.id]),
+                         {'image': out}, format='multipart')
+        call_command('process_image_jobs', '--once', '--workers', '1', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.name = self.recipe.image.name
+        with default_storage.open(self.name) as stored:
+            self.data = stored.read()
+
+    def tearDown(self):
+        images.delete_image(self.name)
+
+    def test_owner_gets_image_with_cache_headers(self):
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content(res), self.data)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertTrue(res['ETag'].startswith('"'))
+
+    def test_accept_header_ignored(self):
+        res = self.client.get(media_url(self.name), HTTP_ACCEPT='image/webp,image/*;q=0.8')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        res = APIClient().get(media_url(self.name), HTTP_ACCEPT='image/jpeg')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_user_gets_404(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unauthenticated_refused(self):
+        res = APIClient().get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_if_none_match_not_modified(self):
+        etag = self.client.get(media_url(self.name))['ETag']
+        res = self.client.get(media_url(self.name), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=10-19')
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(content(res), self.data[10:20])
+        self.assertEqual(res['Content-Range'], f'bytes 10-19/{len(self.data)}')
+
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=-5')
+        self.assertEqual(content(res), self.data[-5:])
+
+        res = self.client.get(media_url(self.name), HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_stale_if_range_sends_whole_file(self):
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content(res), self.data)
+
+    def test_variant_created_on_first_request(self):
+        variant = images.variant_name(self.name, 320, 'webp')
+        self.assertFalse(default_storage.exists(variant))
+
+        res = self.client.get(media_url(variant))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertTrue(default_storage.exists(variant))
+
+    def test_variant_of_missing_source_not_found(self):
+        default_storage.delete(self.name)
+
+        res = self.client.get(media_url(images.variant_name(self.name, 320, 'webp')))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_variant_of_corrupt_source_not_found(self):
+        with open(default_storage.path(self.name), 'wb') as source:
+            source.write(b'not an image')
+
+        res = self.client.get(media_url(images.variant_name(self.name, 320, 'webp')))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unknown_variant_width_not_found(self):
+        res = self.client.get(media_url(images.variant_name(self.name, 321, 'webp')))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RECIPE_MEDIA_X_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect_offload(self):
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(res.content, b'')
@@ -1,15 +1,27 @@
 import tempfile
 import os
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 from PIL import Image
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Ingredient, Tag
+from core.models import ImageBlob, Recipe, RecipeImageJob, Ingredient, Tag
+from core.tests.utils import QueryBudgetMixin
+from recipe import images
+from recipe.pagination import KeysetPagination
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
@@ -17,6 +29,14 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def image_status_url(recipe_id):
+    return reverse('recipe:recipe-image-status', args=[recipe_id])
+
+
+def process_image_jobs():
+    call_command('process_image_jobs', '--once', '--workers', '1', stdout=StringIO())
+
+
 def get_recipe_detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
@@ -53,7 +73,7 @@ class PublicRecipeTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateRecipeTest(TestCase):
+class PrivateRecipeTest(QueryBudgetMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
@@ -72,7 +92,7 @@ class PrivateRecipeTest(TestCase):
         ser = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(ser.data, res.data)
+        self.assertEqual(ser.data, res.data['results'])
 
     def test_recipes_limited_to_user(self):
         user2 = get_user_model().objects.create_user(
@@ -87,8 +107,8 @@ class PrivateRecipeTest(TestCase):
         ser = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, ser.data)
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data['results'], ser.data)
+        self.assertEqual(len(res.data['results']), 1)
 
     def test_view_recipe_detail(self):
         recipe = sample_recipe(user=self.user)
@@ -103,6 +123,136 @@ class PrivateRecipeTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, ser.data)
 
+    def test_list_recipes_query_budget(self):
+        for i in range(10):
+            recipe = sample_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(sample_tag(self.user, name=f'tag {i}'))
+            recipe.ingredients.add(sample_ingredient(self.user, name=f'ing {i}'))
+
+        with self.assertMaxQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_view_recipe_detail_query_budget(self):
+        recipe = sample_recipe(user=self.user)
+        for i in range(5):
+            recipe.tags.add(sample_tag(self.user, name=f'tag {i}'))
+            recipe.ingredients.add(sample_ingredient(self.user, name=f'ing {i}'))
+
+        with self.assertMaxQueries(3):
+            res = self.client.get(get_recipe_detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 5)
+
+    def test_recipes_paginated_with_cursor(self):
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['previous'])
+
+        seen = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen.extend(r['id'] for r in res.data['results'])
+
+        expected = list(Recipe.objects.filter(user=self.user).order_by('id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    @patch.object(KeysetPagination, 'max_page_size', 2)
+    def test_recipes_page_size_capped(self):
+        for i in range(3):
+            sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'page_size': 1000})
+
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_recipes_ordered_by_sort_key(self):
+        sample_recipe(user=self.user, title='b', time_minutes=30)
+        sample_recipe(user=self.user, title='c', time_minutes=10)
+        sample_recipe(user=self.user, title='a', time_minutes=20)
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-title', 'page_size': 2})
+        titles = [r['title'] for r in res.data['results']]
+        res = self.client.get(res.data['next'])
+        titles.extend(r['title'] for r in res.data['results'])
+
+        self.assertEqual(titles, ['c', 'b', 'a'])
+
+    def test_list_sparse_fields(self):
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(sample_tag(self.user, name=f'tag {i}'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title', 'ordering': '-time_minutes'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([set(item) for item in res.data['results']], [{'id', 'title'}] * 5)
+        # no prefetch for tags, and only the columns asked for or sorted on
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"link"', queries[0]['sql'])
+        self.assertNotIn('search_text', queries[0]['sql'])
+        self.assertIn('"time_minutes"', queries[0]['sql'])
+
+    def test_list_image_variants_opt_in(self):
+        sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertNotIn('image_variants', res.data['results'][0])
+
+        res = self.client.get(RECIPES_URL, {'fields': 'id,image_variants'})
+        self.assertEqual(set(res.data['results'][0]), {'id', 'image_variants'})
+
+    def test_list_expand_tags(self):
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(sample_ingredient(self.user))
+        tag.refresh_from_db()
+
+        with self.assertMaxQueries(2):
+            res = self.client.get(RECIPES_URL, {'fields': 'title', 'expand': 'tags'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'title': recipe.title, 'tags': [{'id': tag.id, 'name': tag.name, 'recipe_count': 1}]}
+        ])
+
+        res = self.client.get(RECIPES_URL, {'expand': 'ingredients'})
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
+        self.assertEqual(res.data['results'][0]['ingredients'][0]['name'], 'tomato')
+
+    def test_detail_sparse_fields(self):
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(self.user))
+
+        with self.assertMaxQueries(1):
+            res = self.client.get(get_recipe_detail_url(recipe.id), {'fields': 'price'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'price': '3.56'})
+        self.assertIn('Last-Modified', res)
+
+    def test_unknown_sparse_fields_rejected(self):
+        res = self.client.get(RECIPES_URL, {'fields': 'title,secret', 'expand': 'image'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(res.data), {'fields', 'expand'})
+
+    def test_empty_sparse_fields_rejected(self):
+        for fields in ('', ' , ,'):
+            res = self.client.get(RECIPES_URL, {'fields': fields})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('fields', res.data)
+
     def test_create_basic_recipe(self):
         payload = {
             'title': 'Ghorme',
@@ -172,6 +322,45 @@ class PrivateRecipeTest(TestCase):
     #     self.assertEqual(len(tags), 1)
     #     self.assertIn(new_tag, tags)
 
+    def test_create_recipe_rejects_other_users_tags(self):
+        user2 = get_user_model().objects.create_user(
+            email='other@gmail.com',
+            password='otherpass'
+        )
+        own_tag = sample_tag(self.user, 'vegan')
+        other_tag = sample_tag(user2, 'meat')
+        payload = {
+            'title': 'Kabab',
+            'tags': [own_tag.id, other_tag.id],
+            'time_minutes': 20,
+            'price': 34.00
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['tags']), 1)
+        self.assertIn(str(other_tag.id), res.data['tags'][0])
+        self.assertFalse(Recipe.objects.filter(title='Kabab').exists())
+
+    def test_create_recipe_resolves_ingredients_in_one_query(self):
+        ingredients = [sample_ingredient(self.user, f'ing {i}') for i in range(40)]
+        payload = {
+            'title': 'stew',
+            'ingredients': [ing.id for ing in ingredients],
+            'time_minutes': 60,
+            'price': 12.00
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_URL, payload)
+
+        lookups = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('SELECT') and '"core_ingredient"."id" IN' in q['sql']]
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(len(res.data['ingredients']), 40)
+
     def test_full_update_recipe(self):
         recipe = sample_recipe(self.user)
         recipe.tags.add(sample_tag(self.user))
@@ -203,7 +392,9 @@ class RecipeUploadImageTest(TestCase):
         self.recipe = sample_recipe(self.user)
 
     def tearDown(self):
-        self.recipe.image.delete()
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            images.delete_image(self.recipe.image.name)
 
     def test_upload_image_to_recipe(self):
         url = image_upload_url(self.recipe.id)
@@ -213,10 +404,154 @@ class RecipeUploadImageTest(TestCase):
             ntf.seek(0)
             res = self.client.post(url, {'image': ntf}, format='multipart')
 
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['image_job']['status'], RecipeImageJob.PENDING)
+
+        process_image_jobs()
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
+        res = self.client.get(image_status_url(self.recipe.id))
+        self.assertEqual(res.data['image_job']['status'], RecipeImageJob.DONE)
+
+    def test_uploaded_image_reencoded_without_exif(self):
+        exif = Image.Exif()
+        exif[0x010e] = 'secret description'
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGBA', (4000, 100)).save(ntf, format='PNG', exif=exif)
+            ntf.seek(0)
+            self.client.post(url, {'image': ntf}, format='multipart')
+
+        process_image_jobs()
+        self.recipe.refresh_from_db()
+        with Image.open(self.recipe.image.path) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(len(img.getexif()), 0)
+            self.assertLessEqual(max(img.size), settings.RECIPE_IMAGE_MAX_SIZE)
+
+    def upload(self, size=(1000, 500)):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', size).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        process_image_jobs()
+        self.recipe.refresh_from_db()
+
+    def test_upload_generates_variants(self):
+        self.upload()
+
+        for width in settings.RECIPE_IMAGE_VARIANT_WIDTHS:
+            for fmt in settings.RECIPE_IMAGE_VARIANT_FORMATS:
+                name = images.variant_name(self.recipe.image.name, width, fmt)
+                with Image.open(default_storage.path(name)) as img:
+                    self.assertEqual(img.format, images.VARIANT_FORMATS[fmt])
+                    # never upscaled past the 1000px source
+                    self.assertEqual(img.width, min(width, 1000))
+
+        res = self.client.get(get_recipe_detail_url(self.recipe.id))
+        variants = res.data['image_variants']
+        self.assertEqual(len(variants), len(images.variant_names(self.recipe.image.name)))
+        self.assertTrue(all(v['url'].startswith('http://testserver/') for v in variants))
+
+    def test_regenerated_variants_replace_in_place(self):
+        self.upload()
+        source = self.recipe.image.name
+
+        # a concurrent writer putting the file back right after a delete
+        with patch.object(default_storage, 'delete'):
+            images.generate_variants(source)
+
+        directory = default_storage.path(os.path.splitext(source)[0])
+        self.assertEqual(
+            sorted(os.listdir(directory)),
+            sorted(os.path.basename(name) for name in images.variant_names(source))
+        )
+
+    @override_settings(RECIPE_IMAGE_VARIANTS_EAGER=False)
+    def test_variants_created_lazily(self):
+        self.upload()
+        name = images.variant_name(self.recipe.image.name, 320, 'webp')
+        self.assertFalse(default_storage.exists(name))
+
+        self.assertEqual(images.ensure_variant(self.recipe.image.name, 320, 'webp'), name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_undecodable_upload_fails_job(self):
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'not really a jpeg')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        process_image_jobs()
+        self.recipe.refresh_from_db()
+        job = self.recipe.image_jobs.get()
+        self.assertEqual(job.status, RecipeImageJob.FAILED)
+        self.assertFalse(self.recipe.image)
+
+    def test_recipe_deleted_after_claim(self):
+        recipe = sample_recipe(self.user, title='gone')
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(recipe.id), {'image': ntf}, format='multipart')
+        job = images.claim_job()
+        recipe.delete()
+
+        self.assertEqual(images.process_job(job), RecipeImageJob.FAILED)
+        self.assertFalse(default_storage.exists(job.staged_file))
+        self.assertFalse(RecipeImageJob.objects.exists())
+
+    def test_live_job_not_requeued(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        job = images.claim_job()
+        # slow, but holding its lease however long ago it was queued
+        RecipeImageJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(images.requeue_stale_jobs(), 0)
+        self.assertIsNone(images.claim_job())
+
+    def test_expired_lease_taken_over(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        crashed = images.claim_job()
+        RecipeImageJob.objects.filter(pk=crashed.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        job = images.claim_job()
+        self.assertEqual(job.pk, crashed.pk)
+        # the first worker comes back: it no longer owns the job
+        self.assertEqual(images.process_job(crashed), RecipeImageJob.PROCESSING)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+        self.assertEqual(images.process_job(job), RecipeImageJob.DONE)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image)
+
+    def test_recipe_deleted_while_processing(self):
+        recipe = sample_recipe(self.user, title='gone')
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(recipe.id), {'image': ntf}, format='multipart')
+        job = images.claim_job()
+        saved = []
+
+        def save_then_delete(name, content):
+            saved.append(blob_save(name, content))
+            recipe.delete()
+            return saved[0]
+
+        blob_save = images.blob_storage.save
+        with patch.object(images.blob_storage, 'save', side_effect=save_then_delete):
+            self.assertEqual(images.process_job(job), RecipeImageJob.FAILED)
+
+        self.assertFalse(default_storage.exists(saved[0]))
 
     def test_upload_image_bad_request(self):
         url = image_upload_url(self.recipe.id)
@@ -242,9 +577,9 @@ class RecipeUploadImageTest(TestCase):
         ser2 = RecipeSerializer(recipe2)
         ser3 = RecipeSerializer(recipe3)
 
-        self.assertIn(ser1.data, res.data)
-        self.assertIn(ser2.data, res.data)
-        self.assertNotIn(ser3.data, res.data)
+        self.assertIn(ser1.data, res.data['results'])
+        self.assertIn(ser2.data, res.data['results'])
+        self.assertNotIn(ser3.data, res.data['results'])
 
     def test_filter_recipe_with_ingredient(self):
         recipe1 = sample_recipe(self.user, title='ab paz')
@@ -264,6 +599,136 @@ class RecipeUploadImageTest(TestCase):
         ser2 = RecipeSerializer(recipe2)
         ser3 = RecipeSerializer(recipe3)
 
-        self.assertIn(ser1.data, res.data)
-        self.assertIn(ser2.data, res.data)
-        self.assertNotIn(ser3.data, res.data)
+        self.assertIn(ser1.data, res.data['results'])
+        self.assertIn(ser2.data, res.data['results'])
+        self.assertNotIn(ser3.data, res.data['results'])
+
+    def test_filter_recipe_matching_many_tags_once(self):
+        recipe = sample_recipe(self.user, title='ghorme')
+        tag1 = sample_tag(self.user, name='desert')
+        tag2 = sample_tag(self.user, name='vegan')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{tag1.id},{tag2.id}'}
+        )
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_filter_recipe_match_all_tags(self):
+        recipe1 = sample_recipe(self.user, title='ghorme')
+        recipe2 = sample_recipe(self.user, title='ab gosht')
+        tag1 = sample_tag(self.user, name='desert')
+        tag2 = sample_tag(self.user, name='vegan')
+        recipe1.tags.add(tag1, tag2)
+        recipe2.tags.add(tag1)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        )
+
+        self.assertEqual(res.data['results'], [RecipeSerializer(recipe1).data])
+
+
+class RecipeReplaceImageTest(TransactionTestCase):
+    """old files are removed once the swap commits, so this needs real commits"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            images.delete_image(self.recipe.image.name)
+
+    def upload(self, color='black'):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10), color).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        process_image_jobs()
+        self.recipe.refresh_from_db()
+        return self.recipe.image.path
+
+    def test_replaced_image_file_deleted(self):
+        first_path = self.upload()
+        first_variants = [default_storage.path(name) for name in images.variant_names(self.recipe.image.name)]
+        second_path = self.upload(color='white')
+
+        self.assertFalse(os.path.exists(first_path))
+        self.assertFalse(any(os.path.exists(path) for path in first_variants))
+        self.assertFalse(os.path.exists(os.path.splitext(first_path)[0]))
+        self.assertTrue(os.path.exists(second_path))
+
+    def test_staged_file_deleted_with_pending_job(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        staged = RecipeImageJob.objects.get().staged_file
+
+        self.recipe.delete()
+        self.recipe = sample_recipe(self.user)
+
+        self.assertFalse(default_storage.exists(staged))
+
+
+class SharedImageStorageTest(TransactionTestCase):
+    """blobs are collected after commit, so this needs real commits"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe1 = sample_recipe(self.user)
+        self.recipe2 = sample_recipe(self.user, title='ab gosht')
+
+    def tearDown(self):
+        for name in ImageBlob.objects.values_list('name', flat=True):
+            images.delete_image(name)
+
+    def upload(self, recipe, color='red'):
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGB', (10, 10), color).save(ntf, format='PNG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(recipe.id), {'image': ntf}, format='multipart')
+        process_image_jobs()
+        recipe.refresh_from_db()
+        return recipe.image.name
+
+    def test_identical_uploads_share_one_sharded_file(self):
+        name1 = self.upload(self.recipe1)
+        name2 = self.upload(self.recipe2)
+
+        self.assertEqual(name1, name2)
+        digest = os.path.splitext(os.path.basename(name1))[0]
+        self.assertEqual(name1, f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(ImageBlob.objects.get(name=name1).refcount, 2)
+
+    def test_shared_file_deleted_with_last_reference(self):
+        name = self.upload(self.recipe1)
+        self.upload(self.recipe2)
+        path = default_storage.path(name)
+
+        self.recipe1.delete()
+        self.assertTrue(os.path.exists(path))
+
+        self.upload(self.recipe2, color='blue')
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_reupload_of_same_image_keeps_file(self):
+        name = self.upload(self.recipe1)
+        self.upload(self.recipe1)
+
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
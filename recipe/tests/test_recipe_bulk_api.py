@@ -0,0 +1,163 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ChangeLogEntry, Ingredient, Recipe, RecipeAttrQuerySet, Tag
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class RecipeBulkApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='bulk@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user, name='salt')
+
+    def test_bulk_create(self):
+        payload = [
+            {'title': 'soup', 'time_minutes': 30, 'price': '5.00',
+             'tags': [self.tag.id], 'ingredients': [self.ingredient.id]},
+            {'title': 'salad', 'time_minutes': 10, 'price': '3.00'},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['errors'], [])
+        self.assertEqual([r['index'] for r in res.data['results']], [0, 1])
+        soup = Recipe.objects.get(user=self.user, title='soup')
+        self.assertEqual(list(soup.tags.all()), [self.tag])
+        self.assertEqual(list(soup.ingredients.all()), [self.ingredient])
+        self.assertTrue(ChangeLogEntry.objects.filter(model='recipe', object_id=soup.id).exists())
+
+    def test_bulk_create_reports_item_errors(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'pass123')
+        foreign_tag = Tag.objects.create(user=other, name='meat')
+        payload = [
+            {'title': 'soup', 'time_minutes': 30, 'price': '5.00'},
+            {'title': 'no time', 'price': '5.00'},
+            {'title': 'stolen tag', 'time_minutes': 5, 'price': '1.00', 'tags': [foreign_tag.id]},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([e['index'] for e in res.data['errors']], [1, 2])
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+        self.assertIn('tags', res.data['errors'][1]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_create_all_invalid(self):
+        res = self.client.post(BULK_URL, [{'title': 'x'}], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_requires_list(self):
+        res = self.client.post(BULK_URL, {'title': 'x'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        recipe1 = sample_recipe(self.user, title='a')
+        recipe2 = sample_recipe(self.user, title='b')
+        recipe2.tags.add(self.tag)
+        payload = [
+            {'id': recipe1.id, 'title': 'renamed'},
+            {'id': recipe2.id, 'tags': []},
+            {'id': 0, 'title': 'missing'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([e['index'] for e in res.data['errors']], [2])
+        recipe1.refresh_from_db()
+        self.assertEqual(recipe1.title, 'renamed')
+        self.assertEqual(recipe2.tags.count(), 0)
+
+    def test_bulk_results_have_absolute_urls(self):
+        recipe = sample_recipe(self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(image='uploads/recipe/soup.jpg')
+
+        res = self.client.patch(BULK_URL, [{'id': recipe.id, 'title': 'soup'}], format='json')
+
+        self.assertTrue(res.data['results'][0]['recipe']['image'].startswith('http://testserver/'))
+
+    def test_bulk_update_adjusts_recipe_counts(self):
+        quick = Tag.objects.create(user=self.user, name='quick')
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        recipe1.tags.add(self.tag)
+        recipe2.tags.add(self.tag, quick)
+        payload = [
+            {'id': recipe1.id, 'tags': [quick.id, quick.id]},
+            {'id': recipe2.id, 'tags': [quick.id]},
+            {'id': recipe1.id, 'title': 'ignored repeat'},
+        ]
+
+        with patch.object(RecipeAttrQuerySet, 'reconcile_recipe_counts') as reconcile:
+            res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        reconcile.assert_not_called()
+        self.assertEqual(dict(Tag.objects.values_list('name', 'recipe_count')), {'vegan': 0, 'quick': 2})
+        self.assertFalse(Tag.objects.drifted_recipe_counts().exists())
+
+    def test_bulk_update_rejects_repeated_id(self):
+        recipe = sample_recipe(self.user)
+        payload = [
+            {'id': recipe.id, 'tags': [self.tag.id]},
+            {'id': recipe.id, 'tags': [self.tag.id]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['errors'], [{'index': 1, 'errors': {'id': ['Duplicate id.']}}])
+        self.assertEqual([r['index'] for r in res.data['results']], [0])
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+
+    def test_bulk_ids_must_not_be_booleans(self):
+        recipe = sample_recipe(self.user)
+
+        res = self.client.patch(BULK_URL, [{'id': True, 'title': 'changed'}], format='json')
+        self.assertEqual(res.data['errors'], [{'index': 0, 'errors': {'id': ['Recipe not found.']}}])
+
+        res = self.client.delete(BULK_URL, {'ids': [True]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'mushroom')
+
+    def test_bulk_delete(self):
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pass123')
+        foreign = sample_recipe(other)
+
+        res = self.client.delete(BULK_URL, {'ids': [recipe1.id, recipe2.id, foreign.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], 2)
+        self.assertTrue(Recipe.objects.filter(id=foreign.id).exists())
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class RecipeExportApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='export@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        vegan = Tag.objects.create(user=self.user, name='vegan')
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        pepper = Ingredient.objects.create(user=self.user, name='pepper, black')
+        self.recipes = [sample_recipe(self.user, title=f'recipe {i}') for i in range(5)]
+        self.recipes[0].tags.add(vegan)
+        self.recipes[0].ingredients.add(salt, pepper)
+        self.recipes[3].ingredients.add(salt)
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass123')
+        sample_recipe(other, title='not mine')
+
+    def export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return res, b''.join(res.streaming_content).decode()
+
+    def test_login_required(self):
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        res, body = self.export()
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [recipe.id for recipe in self.recipes])
+        self.assertEqual(rows[0], {
+            'id': self.recipes[0].id, 'title': 'recipe 0', 'time_minutes': 7, 'price': '3.56', 'link': '',
+            'tags': ['vegan'], 'ingredients': ['pepper, black', 'salt'],
+        })
+        self.assertEqual(rows[3]['ingredients'], ['salt'])
+        self.assertEqual(rows[4]['tags'], [])
+
+    def test_export_csv(self):
+        res, body = self.export(format='csv')
+
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('recipes.csv', res['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], 'recipe 0')
+        self.assertEqual(json.loads(rows[0]['ingredients']), ['pepper, black', 'salt'])
+
+    def test_json_accept_falls_back_to_ndjson(self):
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(len(b''.join(res.streaming_content).decode().splitlines()), 5)
+
+    def test_csv_accept_header(self):
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT='text/csv')
+
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_csv_formulas_escaped(self):
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(title='=HYPERLINK("http://evil")')
+        Recipe.objects.filter(pk=self.recipes[2].pk).update(title='@SUM(A1)', link='-1+1')
+        self.recipes[1].tags.add(Tag.objects.create(user=self.user, name='+cmd'))
+        res, body = self.export(format='csv')
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(rows[1]['title'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(rows[2]['title'], "'@SUM(A1)")
+        self.assertEqual(rows[2]['link'], "'-1+1")
+        self.assertEqual(json.loads(rows[1]['tags']), ['+cmd'])
+        self.assertEqual(rows[0]['title'], 'recipe 0')
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_names_looked_up_per_chunk(self):
+        res = self.client.get(EXPORT_URL)
+
+        # the recipe cursor, then one lookup per relation for each of 3 chunks
+        with self.assertNumQueries(1 + 3 * 2):
+            lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
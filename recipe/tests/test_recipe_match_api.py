@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe
+from recipe import matching
+from recipe.indexes import user_indexes
+
+MATCH_URL = reverse('recipe:recipe-match')
+
+
+def sample_recipe(user, ingredients, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    recipe = Recipe.objects.create(user=user, **default)
+    recipe.ingredients.set(ingredients)
+    return recipe
+
+
+class RecipeMatchApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='pantry@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.egg, self.flour, self.milk, self.salt = (
+            Ingredient.objects.create(user=self.user, name=name) for name in ('egg', 'flour', 'milk', 'salt')
+        )
+        self.omelette = sample_recipe(self.user, [self.egg, self.salt], title='omelette')
+        self.pancake = sample_recipe(self.user, [self.egg, self.flour, self.milk], title='pancake')
+        self.bread = sample_recipe(self.user, [self.flour, self.salt], title='bread')
+        sample_recipe(self.user, [self.milk], title='warm milk')
+
+    def match(self, *ingredients, **params):
+        return self.client.post(MATCH_URL, {'ingredients': [i.id for i in ingredients], **params}, format='json')
+
+    def test_ranked_by_missing_ingredients(self):
+        res = self.match(self.egg, self.salt, self.flour)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['recipe']['title'], r['matched'], r['missing']) for r in res.data['results']],
+            [('omelette', 2, 0), ('bread', 2, 0), ('pancake', 2, 1)]
+        )
+
+    def test_max_missing_and_limit(self):
+        res = self.match(self.egg, max_missing=1)
+        self.assertEqual([r['recipe']['title'] for r in res.data['results']], ['omelette'])
+
+        res = self.match(self.egg, self.salt, self.flour, limit=1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_other_users_recipes_never_match(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass123')
+        sample_recipe(other, [Ingredient.objects.create(user=other, name='egg')], title='secret')
+
+        res = self.match(self.egg)
+
+        self.assertNotIn('secret', [r['recipe']['title'] for r in res.data['results']])
+
+    def test_sees_link_changes(self):
+        self.match(self.egg)
+        self.omelette.ingredients.remove(self.salt)
+        self.flour.delete()
+
+        res = self.match(self.egg)
+
+        self.assertEqual(
+            [(r['recipe']['title'], r['missing']) for r in res.data['results']],
+            [('omelette', 0), ('pancake', 1)]
+        )
+
+    def test_invalid_payload(self):
+        res = self.client.post(MATCH_URL, {'ingredients': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PantryMatrixTest(TestCase):
+    def test_overridden_rows_scored_and_repacked(self):
+        matrix = matching.PantryMatrix([(1, 10), (1, 11), (2, 11), (3, 12)])
+        matrix.replace_rows({1: {12}, 4: {10, 12}, 3: set()})
+
+        self.assertEqual(matrix.match(frozenset({10, 12}), 10), [(4, 2, 0), (1, 1, 0)])
+        matrix.repack()
+        self.assertEqual(matrix.overrides, {})
+        self.assertEqual(matrix.match(frozenset({10, 12}), 10), [(4, 2, 0), (1, 1, 0)])
+        self.assertEqual(matrix.recipe_ids.tolist(), [1, 2, 4])
+        self.assertEqual(matrix.ingredients.tolist(), [12, 11, 10, 12])
+
+    def test_empty_matrix(self):
+        self.assertEqual(matching.PantryMatrix([]).match(frozenset({1}), 10), [])
+
+
+class PantryMatrixUpdateTest(TransactionTestCase):
+    """in-place updates happen on commit"""
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('pantry@gmail.com', 'testpass123')
+        self.egg = Ingredient.objects.create(user=self.user, name='egg')
+        self.recipe = sample_recipe(self.user, [self.egg], title='boiled egg')
+
+    def tearDown(self):
+        user_indexes.clear()
+
+    def test_loaded_matrix_patched_instead_of_rebuilt(self):
+        matrix = matching.get_matrix(self.user.pk)
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        self.recipe.ingredients.add(salt)
+        other = sample_recipe(self.user, [salt], title='salt')
+        Recipe.objects.filter(pk=other.pk).delete()
+
+        with self.assertNumQueries(0):
+            current = matching.get_matrix(self.user.pk)
+        self.assertIs(current, matrix)
+        self.assertEqual(current.match(frozenset({self.egg.pk, salt.pk}), 10), [(self.recipe.pk, 2, 0)])
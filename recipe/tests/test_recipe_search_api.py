@@ -0,0 +1,139 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import bump_data_version
+from recipe.indexes import user_indexes
+from recipe.search import InvertedIndex
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+def titles(res):
+    return [recipe['title'] for recipe in res.data['results']]
+
+
+class RecipeSearchApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='search@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_title_matches_rank_above_name_matches(self):
+        soup = sample_recipe(self.user, title='bean soup')
+        stew = sample_recipe(self.user, title='lamb stew')
+        stew.ingredients.add(Ingredient.objects.create(user=self.user, name='beans'))
+        stew.ingredients.add(Ingredient.objects.create(user=self.user, name='bean'))
+        sample_recipe(self.user, title='carrot cake')
+
+        res = self.client.get(RECIPES_URL, {'search': 'bean'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(titles(res), [soup.title, stew.title])
+
+    def test_all_terms_must_match(self):
+        sample_recipe(self.user, title='tomato soup')
+        salad = sample_recipe(self.user, title='tomato salad')
+        salad.tags.add(Tag.objects.create(user=self.user, name='summer'))
+
+        res = self.client.get(RECIPES_URL, {'search': 'Tomato SUMMER'})
+
+        self.assertEqual(titles(res), ['tomato salad'])
+
+    def test_typo_falls_back_to_trigram_match(self):
+        sample_recipe(self.user, title='tomato soup')
+        sample_recipe(self.user, title='onion soup')
+
+        res = self.client.get(RECIPES_URL, {'search': 'tomatto'})
+
+        self.assertEqual(titles(res), ['tomato soup'])
+
+    def test_search_sees_changes_made_after_first_search(self):
+        recipe = sample_recipe(self.user, title='stew')
+        self.assertEqual(titles(self.client.get(RECIPES_URL, {'search': 'vegan'})), [])
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+        res = self.client.get(RECIPES_URL, {'search': 'vegan'})
+
+        self.assertEqual(titles(res), ['stew'])
+
+    def test_search_limited_to_user(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass123')
+        sample_recipe(other, title='secret soup')
+
+        res = self.client.get(RECIPES_URL, {'search': 'soup'})
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_ranked_results_paginate(self):
+        for i in range(5):
+            sample_recipe(self.user, title=f'soup {i}')
+        sample_recipe(self.user, title='soup soup')
+
+        res = self.client.get(RECIPES_URL, {'search': 'soup', 'page_size': 2})
+        seen = titles(res)
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += titles(res)
+
+        self.assertEqual(seen[0], 'soup soup')
+        self.assertEqual(sorted(seen), sorted(Recipe.objects.values_list('title', flat=True)))
+
+    def test_explicit_ordering_wins_over_rank(self):
+        sample_recipe(self.user, title='b soup')
+        sample_recipe(self.user, title='a soup')
+
+        res = self.client.get(RECIPES_URL, {'search': 'soup', 'ordering': 'title'})
+
+        self.assertEqual(titles(res), ['a soup', 'b soup'])
+
+
+class InvertedIndexTest(TestCase):
+    def test_scores_sum_over_terms(self):
+        index = InvertedIndex([(1, 'tomato soup', ''), (2, 'soup', 'tomato')])
+
+        self.assertEqual(index.search('tomato soup', 10), [(1, 2.0), (2, 1.4)])
+        self.assertEqual(index.search('cake', 10), [])
+
+
+class UserIndexCacheTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='index@gmail.com',
+            password='testpass123'
+        )
+
+    def test_index_not_stored_when_version_moves_while_building(self):
+        builds = []
+
+        def build(user_id):
+            builds.append(user_id)
+            bump_data_version(user_id, scope='test')
+            return object()
+
+        user_indexes.get('test', self.user.pk, build, scope='test')
+        user_indexes.get('test', self.user.pk, build, scope='test')
+
+        self.assertEqual(len(builds), 2)
+        self.assertIsNone(user_indexes.version_of('test', self.user.pk))
+
+    def tearDown(self):
+        user_indexes.clear()
@@ -0,0 +1,154 @@
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+from recipe import bulk, stats
+
+STATS_URL = reverse('recipe:stats')
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class RecipeStatsApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='stats@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='vegan')
+        self.dinner = Tag.objects.create(user=self.user, name='dinner')
+        self.salt = Ingredient.objects.create(user=self.user, name='salt')
+
+    def get_stats(self):
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def assert_in_sync(self):
+        self.assertEqual(stats.drifted([self.user.pk]), [])
+
+    def test_login_required(self):
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_no_recipes(self):
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 0)
+        self.assertEqual(data['price'], {'avg': None, 'min': None, 'max': None})
+        self.assertEqual(data['time_minutes'], {'avg': None, 'min': None, 'max': None})
+        self.assertEqual([tag['recipe_count'] for tag in data['tags']], [0, 0])
+
+    def test_stats_of_existing_recipes(self):
+        first = sample_recipe(self.user, price=2.00, time_minutes=10)
+        first.tags.add(self.vegan, self.dinner)
+        second = sample_recipe(self.user, price=7.00, time_minutes=25)
+        second.tags.add(self.dinner)
+        second.ingredients.add(self.salt)
+        sample_recipe(get_user_model().objects.create_user('other@gmail.com', 'testpass123'), price=90)
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 2)
+        self.assertEqual(data['price'], {'avg': '4.50', 'min': '2.00', 'max': '7.00'})
+        self.assertEqual(data['time_minutes'], {'avg': 17.5, 'min': 10, 'max': 25})
+        self.assertEqual(
+            [(tag['name'], tag['recipe_count']) for tag in data['tags']],
+            [('dinner', 2), ('vegan', 1)]
+        )
+        self.assertEqual(data['ingredients'], [{'id': self.salt.id, 'name': 'salt', 'recipe_count': 1}])
+
+    def test_rollup_follows_changes(self):
+        self.get_stats()
+        cheap = sample_recipe(self.user, price=1.00, time_minutes=5)
+        cheap.tags.add(self.vegan, self.dinner)
+        dear = sample_recipe(self.user, price=9.00, time_minutes=50)
+        dear.tags.add(self.dinner)
+        dear.ingredients.add(self.salt)
+        self.assert_in_sync()
+
+        cheap.price = 3
+        cheap.save()
+        dear.tags.remove(self.dinner, self.vegan)
+        self.vegan.recipe_set.add(dear)
+        self.assert_in_sync()
+
+        dear.delete()
+        self.dinner.recipe_set.clear()
+        self.salt.delete()
+        self.assert_in_sync()
+
+        data = self.get_stats()
+        self.assertEqual(data['recipe_count'], 1)
+        self.assertEqual(data['price'], {'avg': '3.00', 'min': '3.00', 'max': '3.00'})
+        self.assertEqual(data['time_minutes'], {'avg': 5.0, 'min': 5, 'max': 5})
+        self.assertEqual(
+            [(tag['name'], tag['recipe_count']) for tag in data['tags']],
+            [('vegan', 1), ('dinner', 0)]
+        )
+        self.assertEqual(data['ingredients'], [])
+
+    def test_rollup_follows_bulk_writes(self):
+        self.get_stats()
+        bulk.create_recipes(self.user, [
+            {'title': 'a', 'price': 4, 'time_minutes': 20, 'tags': [self.vegan.id]},
+            {'title': 'b', 'price': 6, 'time_minutes': 40, 'tags': [self.vegan.id]},
+        ])
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipe_count'], 2)
+        self.assertEqual(data['price']['avg'], '5.00')
+        self.assertEqual(data['tags'][0], {'id': self.vegan.id, 'name': 'vegan', 'recipe_count': 2})
+        self.assert_in_sync()
+
+    def test_rollup_follows_bulk_updates_without_rebuild(self):
+        cheap = sample_recipe(self.user, price=2, time_minutes=5)
+        dear = sample_recipe(self.user, price=9, time_minutes=50)
+        self.get_stats()
+
+        with patch.object(stats, 'rebuild') as rebuild:
+            bulk.update_recipes(
+                self.user, [cheap, dear], [{'price': Decimal('7.00')}, {'title': 'renamed', 'time_minutes': 30}]
+            )
+        rebuild.assert_not_called()
+
+        data = self.get_stats()
+        self.assertEqual(data['price'], {'avg': '8.00', 'min': '7.00', 'max': '9.00'})
+        self.assertEqual(data['time_minutes'], {'avg': 17.5, 'min': 5, 'max': 30})
+        self.assert_in_sync()
+
+    def test_recompute_command_repairs_drift(self):
+        sample_recipe(self.user)
+        self.get_stats()
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=7)
+
+        with self.assertRaises(CommandError):
+            call_command('recompute_recipe_stats', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('recompute_recipe_stats', stdout=out)
+
+        self.assertIn('1 had drifted', out.getvalue())
+        self.assertEqual(self.get_stats()['recipe_count'], 1)
+        call_command('recompute_recipe_stats', '--check', stdout=StringIO())
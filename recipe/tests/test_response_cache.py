@@ -0,0 +1,222 @@
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.utils import QueryBudgetMixin
+from recipe.cache import get_data_version
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def get_recipe_detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class ResponseCacheTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='cache@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        sample_recipe(self.user)
+        first = self.client.get(RECIPES_URL)
+
+        with self.assertMaxQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+
+    def test_query_params_part_of_key(self):
+        sample_recipe(self.user, title='a')
+        sample_recipe(self.user, title='b')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_create_invalidates(self):
+        self.client.get(RECIPES_URL)
+        sample_recipe(self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_m2m_change_invalidates(self):
+        recipe = sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.client.get(RECIPES_URL)
+        recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
+
+    def test_other_users_writes_do_not_invalidate(self):
+        other = get_user_model().objects.create_user(
+            email='other@gmail.com',
+            password='testpass123'
+        )
+        Tag.objects.create(user=self.user, name='vegan')
+        self.client.get(TAGS_URL)
+        Tag.objects.create(user=other, name='meat')
+
+        with self.assertMaxQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}
+            with override_settings(CACHES=caches):
+                self.client.get(RECIPES_URL)
+                sample_recipe(self.user)
+                self.client.get(RECIPES_URL)
+
+                with self.assertMaxQueries(0):
+                    res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+
+class ResponseCacheCommitTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='commit@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_cached_before_commit_not_kept(self):
+        with transaction.atomic():
+            sample_recipe(self.user)
+            # stored under the version a concurrent reader would see
+            version = get_data_version(self.user.pk)
+            self.client.get(RECIPES_URL)
+
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+        # read from the database again, not from the entry stored above
+        with self.assertNumQueries(3):
+            self.client.get(RECIPES_URL)
+
+
+class ConditionalGetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='etag@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def test_list_not_modified(self):
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertMaxQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_list_modified_after_change(self):
+        etag = self.client.get(RECIPES_URL)['ETag']
+        sample_recipe(self.user, title='other')
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_detail_not_modified_since(self):
+        url = get_recipe_detail_url(self.recipe.id)
+        last_modified = self.client.get(url)['Last-Modified']
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_wins_over_modified_since(self):
+        url = get_recipe_detail_url(self.recipe.id)
+        res = self.client.get(url)
+        last_modified, etag = res['Last-Modified'], res['ETag']
+        # a second change within the same second as the read
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            title='changed', updated_at=self.recipe.updated_at + timedelta(microseconds=1)
+        )
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Last-Modified'], last_modified)
+
+    def test_detail_modified_by_tag_change(self):
+        url = get_recipe_detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='vegan'))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_detail_not_modified_by_other_recipes(self):
+        url = get_recipe_detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        sample_recipe(self.user, title='other')
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_modified_by_usage_of_its_tag(self):
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        self.recipe.tags.add(tag)
+        url = get_recipe_detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        sample_recipe(self.user, title='other').tags.add(tag)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['recipe_count'], 2)
+
+    def test_detail_sparse_not_modified(self):
+        url = get_recipe_detail_url(self.recipe.id)
+        etag = self.client.get(url, {'fields': 'id,title'})['ETag']
+
+        with self.assertMaxQueries(1):
+            res = self.client.get(url, {'fields': 'id,title'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
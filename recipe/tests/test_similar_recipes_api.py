@@ -0,0 +1,101 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeSignature, Tag
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    default = {
+        'title': 'mushroom',
+        'time_minutes': 7,
+        'price': 3.56
+    }
+    default.update(params)
+
+    return Recipe.objects.create(user=user, **default)
+
+
+class SimilarRecipesApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='similar@gmail.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.ingredients = [Ingredient.objects.create(user=self.user, name=f'ingredient {i}') for i in range(12)]
+        self.tag = Tag.objects.create(user=self.user, name='dinner')
+
+        self.base = sample_recipe(self.user, title='base')
+        self.base.ingredients.set(self.ingredients[:8])
+        self.base.tags.add(self.tag)
+        self.twin = sample_recipe(self.user, title='twin')
+        self.twin.ingredients.set(self.ingredients[:8])
+        self.twin.tags.add(self.tag)
+        self.close = sample_recipe(self.user, title='close')
+        self.close.ingredients.set(self.ingredients[:7] + self.ingredients[8:9])
+        self.close.tags.add(self.tag)
+        self.unrelated = sample_recipe(self.user, title='unrelated')
+        self.unrelated.ingredients.set(self.ingredients[9:])
+
+    def titles(self, recipe):
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [result['recipe']['title'] for result in res.data['results']]
+
+    def test_most_similar_first(self):
+        res = self.client.get(similar_url(self.base.id))
+
+        self.assertEqual([r['recipe']['title'] for r in res.data['results']], ['twin', 'close'])
+        self.assertEqual(res.data['results'][0]['similarity'], 1.0)
+
+    def test_index_follows_link_changes(self):
+        self.twin.ingredients.clear()
+        self.ingredients[0].delete()
+        self.unrelated.ingredients.set(self.ingredients[1:8])
+        self.unrelated.tags.add(self.tag)
+
+        self.assertEqual(self.titles(self.base), ['unrelated', 'close'])
+
+    def test_recipe_without_links_has_no_similar(self):
+        lonely = sample_recipe(self.user, title='lonely')
+
+        self.assertEqual(self.titles(lonely), [])
+
+    def test_other_users_recipes_never_similar(self):
+        other = get_user_model().objects.create_user('other@gmail.com', 'testpass123')
+        copy = sample_recipe(other, title='copy')
+        copy.ingredients.set(self.ingredients[:8])
+
+        self.assertNotIn('copy', self.titles(self.base))
+        res = self.client.get(similar_url(copy.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_matches_incremental_index(self):
+        before = list(RecipeSignature.objects.order_by('recipe_id').values_list('recipe_id', 'signature'))
+        RecipeSignature.objects.all().delete()
+        call_command('rebuild_similarity_index', stdout=StringIO())
+
+        after = list(RecipeSignature.objects.order_by('recipe_id').values_list('recipe_id', 'signature'))
+        self.assertEqual([(pk, bytes(sig)) for pk, sig in before], [(pk, bytes(sig)) for pk, sig in after])
+        self.assertEqual(similarity.similar_recipes(self.base, 1)[0][0], self.twin.id)
+
+    def test_rebuild_over_live_index(self):
+        # recipes already indexed, e.g. by link changes during the rebuild
+        indexed = RecipeSignature.objects.count()
+        call_command('rebuild_similarity_index', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(RecipeSignature.objects.count(), indexed)
+        self.assertEqual(similarity.similar_recipes(self.base, 1)[0][0], self.twin.id)
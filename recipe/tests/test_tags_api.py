@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
@@ -7,9 +9,11 @@ from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
 
+from recipe.bulk import _find_names as find_names
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_UPSERT_URL = reverse('recipe:tag-upsert')
 
 
 def create_user(email, password):
@@ -36,13 +40,13 @@ class PrivateTagsTest(TestCase):
     def test_retrieve_tags(self):
         Tag.objects.create(user=self.user, name='tag1')
         Tag.objects.create(user=self.user, name='tag2')
-        tags = Tag.objects.all().order_by('name')
+        tags = Tag.objects.all().order_by('id')
         serializer = TagSerializer(tags, many=True)
 
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tag_owned(self):
         user2 = create_user('other@gmail.com', 'pass123')
@@ -52,8 +56,8 @@ class PrivateTagsTest(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tags_successful(self):
         payload = {
@@ -72,6 +76,57 @@ class PrivateTagsTest(TestCase):
         res = self.client.post(TAGS_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_tag_name_taken_ignoring_case(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        create_user('other@gmail.com', 'test1234').tag_set.create(name='vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_upsert_tags(self):
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {'names': ['vegan', 'Quick', 'quick', 'VEGAN']}
+
+        res = self.client.post(TAGS_UPSERT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        quick = Tag.objects.get(user=self.user, name='Quick')
+        self.assertEqual(
+            [(tag['id'], tag['name'], tag['created']) for tag in res.data['results']],
+            [(vegan.id, 'Vegan', False), (quick.id, 'Quick', True), (quick.id, 'Quick', True),
+             (vegan.id, 'Vegan', False)]
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+        # a retry creates nothing
+        res = self.client.post(TAGS_UPSERT_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['id'] for tag in res.data['results']], [vegan.id, quick.id, quick.id, vegan.id])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_upsert_tag_inserted_concurrently_not_created(self):
+        def find_then_race(user, model, names):
+            found = find_names(user, model, names)
+            # another request inserting the same name before this one does
+            if not Tag.objects.filter(user=self.user).exists():
+                Tag.objects.create(user=self.user, name='vegan')
+            return found
+
+        with patch('recipe.bulk._find_names', side_effect=find_then_race):
+            res = self.client.post(TAGS_UPSERT_URL, {'names': ['Vegan']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'vegan')
+        self.assertFalse(res.data['results'][0]['created'])
+
+    def test_upsert_tags_invalid(self):
+        res = self.client.post(TAGS_UPSERT_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_tags_assigned_to_recipe(self):
         tag1 = Tag.objects.create(
             user=self.user,
@@ -91,8 +146,53 @@ class PrivateTagsTest(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
+        tag1.refresh_from_db()
         ser1 = TagSerializer(tag1)
         ser2 = TagSerializer(tag2)
 
-        self.assertIn(ser1.data, res.data)
-        self.assertNotIn(ser2.data, res.data)
+        self.assertIn(ser1.data, res.data['results'])
+        self.assertNotIn(ser2.data, res.data['results'])
+
+    def test_tags_ordered_by_usage(self):
+        rare = Tag.objects.create(user=self.user, name='rare')
+        common = Tag.objects.create(user=self.user, name='common')
+        unused = Tag.objects.create(user=self.user, name='unused')
+        for title in ('a', 'b'):
+            recipe = Recipe.objects.create(title=title, time_minutes=5, price=2.00, user=self.user)
+            recipe.tags.add(common)
+        recipe.tags.add(rare)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-usage'})
+
+        self.assertEqual(
+            [(tag['id'], tag['recipe_count']) for tag in res.data['results']],
+            [(common.id, 2), (rare.id, 1), (unused.id, 0)]
+        )
+
+    def test_recipe_count_follows_links(self):
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        other = Tag.objects.create(user=self.user, name='quick')
+        first = Recipe.objects.create(title='a', time_minutes=5, price=2.00, user=self.user)
+        second = Recipe.objects.create(title='b', time_minutes=5, price=2.00, user=self.user)
+
+        first.tags.add(tag, other)
+        tag.recipe_set.add(second)
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+
+        # stale instances never write their count back
+        stale = Tag.objects.get(pk=other.pk)
+        second.tags.add(other)
+        stale.name = 'fast'
+        stale.save()
+        other.refresh_from_db()
+        self.assertEqual((other.name, other.recipe_count), ('fast', 2))
+
+        first.tags.remove(tag, tag)
+        second.delete()
+        other.recipe_set.clear()
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'recipe_count')),
+            {'vegan': 0, 'fast': 0}
+        )
+        self.assertFalse(Tag.objects.drifted_recipe_counts().exists())
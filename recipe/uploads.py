@@ -0,0 +1,183 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from core.models import RecipeImageUpload
+from recipe import images
+
+READ_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+CHUNK_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class OffsetConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Chunk does not start at the current upload offset.'
+    default_code = 'offset_conflict'
+
+
+class ChunkTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Chunk goes past the declared upload size.'
+    default_code = 'too_large'
+
+
+def max_upload_size():
+    return getattr(settings, 'RECIPE_IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def start_upload(recipe, size, filename=''):
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    staged = default_storage.save(
+        os.path.join(images.STAGING_DIR, f'{uuid.uuid4()}{ext}'), ContentFile(b'')
+    )
+    return RecipeImageUpload.objects.create(recipe=recipe, staged_file=staged, size=size)
+
+
+def parse_chunk_headers(meta, upload):
+    """(start, length, sha256 digest or None) of the chunk described by the
+    Content-Range, Content-Length and optional Digest headers"""
+    match = CONTENT_RANGE.match(meta.get('HTTP_CONTENT_RANGE', ''))
+    if not match:
+        raise ValidationError({'Content-Range': 'Expected "bytes <start>-<end>/<size>".'})
+    start, end, total = (int(value) for value in match.groups())
+    if total != upload.size or end < start:
+        raise ValidationError({'Content-Range': 'Does not match the upload.'})
+    if end >= upload.size:
+        raise ChunkTooLarge()
+    try:
+        length = int(meta.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length != end - start + 1:
+        raise ValidationError({'Content-Length': 'Does not match Content-Range.'})
+
+    digest = None
+    for part in meta.get('HTTP_DIGEST', '').split(','):
+        algorithm, _, value = part.strip().partition('=')
+        if algorithm.lower() == 'sha-256':
+            try:
+                digest = base64.b64decode(value, validate=True)
+            except binascii.Error:
+                raise ValidationError({'Digest': 'Invalid sha-256 value.'})
+    return start, length, digest
+
+
+def write_chunk(upload, stream, start, length, digest=None):
+    """stream length bytes from stream into the staged file at start,
+    hashing as they pass; the offset only advances once the whole chunk
+    arrived intact, so a failed chunk is simply sent again.
+
+    No transaction is held while the body arrives: a conditional UPDATE
+    claims the offset first, so a concurrent chunk for the same bytes gets
+    409 instead of writing over them. A claim left by a dropped request
+    lapses after CHUNK_CLAIM_TIMEOUT."""
+    claim = uuid.uuid4()
+    now = timezone.now()
+    claimed = RecipeImageUpload.objects.filter(pk=upload.pk, offset=start).filter(
+        Q(chunk_claim__isnull=True) | Q(chunk_claimed_until__lt=now)
+    ).update(chunk_claim=claim, chunk_claimed_until=now + CHUNK_CLAIM_TIMEOUT)
+    if not claimed:
+        upload.refresh_from_db(fields=['offset'])
+        if upload.offset == start:
+            raise OffsetConflict(f'A chunk starting at byte {start} is already being received.')
+        raise OffsetConflict(f'Expected a chunk starting at byte {upload.offset}.')
+
+    written = False
+    try:
+        checksum = hashlib.sha256()
+        received = 0
+        with default_storage.open(upload.staged_file, 'r+b') as out:
+            out.seek(start)
+            while received < length:
+                block = stream.read(min(READ_SIZE, length - received))
+                if not block:
+                    break
+                checksum.update(block)
+                out.write(block)
+                received += len(block)
+        if received != length:
+            raise ValidationError({'detail': 'Chunk ended early.'})
+        if digest is not None and checksum.digest() != digest:
+            raise ValidationError({'Digest': 'Chunk checksum mismatch.'})
+
+        written = RecipeImageUpload.objects.filter(pk=upload.pk, chunk_claim=claim, offset=start).update(
+            offset=start + length, chunk_claim=None, chunk_claimed_until=None, updated_at=timezone.now()
+        )
+        if not written:
+            raise OffsetConflict('The chunk took too long and was taken over, send it again.')
+    finally:
+        if not written:
+            RecipeImageUpload.objects.filter(pk=upload.pk, chunk_claim=claim).update(
+                chunk_claim=None, chunk_claimed_until=None
+            )
+    upload.refresh_from_db()
+    return upload
+
+
+def file_sha256(name):
+    checksum = hashlib.sha256()
+    with default_storage.open(name) as source:
+        for block in source.chunks(READ_SIZE):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def complete_upload(upload, sha256=None):
+    """queue a fully received upload for the image worker.
+
+    The sha256 check reads the whole file again instead of carrying a
+    digest across chunks: hashlib cannot save a running state, and chunks
+    of one upload reach different processes. At the 20 MB upload cap the
+    read and hash take about 25 ms, once per upload. It runs before the
+    row lock is taken, which is safe because a full upload accepts no
+    more chunks."""
+    upload.refresh_from_db(fields=['offset'])
+    if upload.offset != upload.size:
+        raise OffsetConflict(f'Only {upload.offset} of {upload.size} bytes were received.')
+    if sha256 and file_sha256(upload.staged_file) != sha256.lower():
+        raise ValidationError({'sha256': 'Upload checksum mismatch.'})
+
+    with transaction.atomic():
+        upload = RecipeImageUpload.objects.select_for_update().select_related('recipe').filter(pk=upload.pk).first()
+        if upload is None:
+            # completed by a concurrent request meanwhile
+            raise NotFound()
+        job = images.queue_staged(upload.recipe, upload.staged_file)
+        # the staged file is the job's now, not to be deleted with the upload
+        upload.staged_file = ''
+        upload.delete()
+    return job
+
+
+def expire_uploads(older_than):
+    """drop uploads abandoned before completion, with their staged files"""
+    stale = RecipeImageUpload.objects.filter(updated_at__lt=timezone.now() - older_than)
+    expired = 0
+    for upload in stale.iterator():
+        default_storage.delete(upload.staged_file)
+        upload.delete()
+        expired += 1
+    return expired
+
+
+@receiver(post_delete, sender=RecipeImageUpload)
+def delete_staged_file(sender, instance, **kwargs):
+    # e.g. a recipe deleted in the middle of its upload
+    if instance.staged_file:
+        transaction.on_commit(lambda: default_storage.delete(instance.staged_file))
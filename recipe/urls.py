@@ -12,5 +12,7 @@ router.register('recipes', views.RecipeViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('changes/', views.ChangeFeedView.as_view(), name='changes'),
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
     path('', include(router.urls))
 ]
@@ -1,29 +1,105 @@
+import base64
+import binascii
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from core.models import ChangeLogEntry, Tag, Ingredient, Recipe
+from recipe import autocomplete, bulk, export, images, matching, media, serializers, similarity, stats, uploads
+from recipe.cache import (
+    CachedListMixin, make_recipe_etag, recipe_etag, recipe_last_modified, recipe_links_shown, response_etag,
+)
+from recipe.filters import AliasOrderingFilter
+from recipe.pagination import KeysetPagination
+from recipe.search import RecipeSearchFilter
+from user.authentication import CachedTokenAuthentication
+
 
-from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+def is_object_id(value):
+    # bool is an int subclass, true must not stand for the object with id 1
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
-class BaseRecipeAttr(viewsets.GenericViewSet,
+class BaseRecipeAttr(CachedListMixin,
+                     viewsets.GenericViewSet,
                      mixins.ListModelMixin,
                      mixins.CreateModelMixin):
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication, SessionAuthentication)
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    pagination_class = KeysetPagination
+    filter_backends = (AliasOrderingFilter,)
+    # usage is the denormalized recipe_count, indexed per user
+    ordering_fields = ('id', 'name', 'usage')
+    ordering_aliases = {'usage': 'recipe_count'}
+    ordering = 'id'
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
 
     def get_queryset(self):
         assigned_only = bool(self.request.query_params.get('assigned_only'))
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = self.queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).distinct()
+            queryset = queryset.assigned()
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'upsert':
+            return serializers.AttrNamesSerializer
+        return self.serializer_class
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            # lost a race against another request creating the same name
+            raise ValidationError({'name': [
+                f'{self.queryset.model._meta.verbose_name} with this name already exists.'
+            ]})
+
+    @action(methods=['POST'], detail=False, url_path='upsert')
+    def upsert(self, request):
+        """ids of the rows named in {"names": [...]}, matched ignoring case
+        and created where missing, in request order; safe to retry"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = bulk.upsert_names(request.user, self.queryset.model, serializer.validated_data['names'])
+        results = [
+            {'id': pk, 'name': name, 'created': created}
+            for pk, name, created in rows.values()
+        ]
+        created = any(result['created'] for result in results)
+        return Response({'results': results}, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """names starting with ?q= (case-insensitive), alphabetically, at
+        most ?limit= of them; answered from the in-memory prefix index"""
+        try:
+            limit = int(request.query_params.get('limit', self.autocomplete_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Expected an integer.'})
+        limit = max(1, min(limit, self.autocomplete_max_limit))
+        index = autocomplete.get_index(self.queryset.model, request.user.pk)
+        return Response(index.search(request.query_params.get('q', '').strip(), limit))
 
 
 class TagsViewSet(BaseRecipeAttr):
@@ -36,11 +112,27 @@ class IngredientViewSet(BaseRecipeAttr):
     queryset = Ingredient.objects.all()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+@method_decorator(condition(etag_func=response_etag), name='list')
+@method_decorator(
+    condition(etag_func=recipe_etag, last_modified_func=recipe_last_modified),
+    name='retrieve'
+)
+class RecipeViewSet(CachedListMixin, viewsets.ModelViewSet):
     serializer_class = serializers.RecipeSerializer
-    authentication_classes = (TokenAuthentication, SessionAuthentication)
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all()
+    pagination_class = KeysetPagination
+    filter_backends = (RecipeSearchFilter,)
+    ordering_fields = ('id', 'title', 'time_minutes')
+    ordering = 'id'
+    bulk_max_items = 1000
+    similar_k = 10
+    similar_max_k = 50
+    # actions answering ?fields= (which fields to return) and ?expand=
+    # (which id lists to return as nested objects instead)
+    sparse_actions = ('list', 'retrieve')
+    expandable_fields = ('tags', 'ingredients')
 
     def query_params_to_int(self, qs):
         return [int(str_id) for str_id in qs.split(',')]
@@ -48,36 +140,389 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        match_all = self.request.query_params.get('match') == 'all'
         queryset = self.queryset
 
         if tags:
             tags_ids = self.query_params_to_int(tags)
-            queryset = queryset.filter(tags__id__in=tags_ids)
+            queryset = queryset.having_related('tags', tags_ids, match_all)
 
         if ingredients:
             ingredients_ids = self.query_params_to_int(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
-        return queryset.filter(user=self.request.user)
+            queryset = queryset.having_related('ingredients', ingredients_ids, match_all)
+
+        queryset = queryset.filter(user=self.request.user)
+        if self.action in self.sparse_actions:
+            queryset = queryset.only(*self.get_loaded_columns(queryset)).prefetch_related(*self.get_prefetches())
+        return queryset
+
+    def _query_param_list(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return list(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+
+    def get_all_serializer_fields(self):
+        """every field the serializer can return, opt-in ones included;
+        built once per request"""
+        if not hasattr(self, '_all_serializer_fields'):
+            serializer_class = self.get_serializer_class()
+            self._all_serializer_fields = serializer_class(context={'fields': serializer_class.Meta.fields}).fields
+        return self._all_serializer_fields
+
+    def get_sparse_fields(self):
+        """(names of the fields to return, or None for all, names of the
+        fields to expand) from ?fields= and ?expand=; expanding a field
+        implies returning it; other actions return every field as is"""
+        if self.action not in self.sparse_actions:
+            return None, []
+        if not hasattr(self, '_sparse_fields'):
+            available = self.get_all_serializer_fields()
+            fields = self._query_param_list('fields')
+            expand = self._query_param_list('expand') or []
+            errors = {}
+            unknown = [name for name in fields or () if name not in available]
+            if unknown:
+                errors['fields'] = [f'Unknown field "{name}".' for name in unknown]
+            elif fields == []:
+                errors['fields'] = ['Name at least one field, or leave the parameter out.']
+            unknown = [name for name in expand if name not in self.expandable_fields]
+            if unknown:
+                errors['expand'] = [f'Cannot expand "{name}".' for name in unknown]
+            if errors:
+                raise ValidationError(errors)
+            if fields is not None:
+                fields += [name for name in expand if name not in fields]
+            self._sparse_fields = (fields, expand)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.sparse_actions:
+            context['fields'], context['expand'] = self.get_sparse_fields()
+        return context
+
+    def get_loaded_columns(self, queryset):
+        """the recipe columns the requested fields read, plus what the
+        cursor (list) or Last-Modified (retrieve) needs; the rest, the
+        search columns included, stays in the database"""
+        serializer_fields = self.get_all_serializer_fields()
+        fields, _ = self.get_sparse_fields()
+        names = {'id'}
+        for name in fields if fields is not None else serializer_fields:
+            names.add(serializer_fields[name].source)
+        if self.action == 'list':
+            names.update(column.lstrip('-') for column in self.paginator.get_ordering(self.request, queryset, self))
+        else:
+            names.add('updated_at')
+        return sorted(names & {field.name for field in Recipe._meta.concrete_fields})
+
+    def get_prefetches(self):
+        """related rows loaded up front, so the number of queries stays
+        fixed however many recipes are serialized: only ids for an id list,
+        whole rows for an expanded one, nothing for a field not returned"""
+        fields, expand = self.get_sparse_fields()
+        prefetches = []
+        for name in self.expandable_fields:
+            if fields is not None and name not in fields:
+                continue
+            if name in expand or self.action == 'retrieve':
+                prefetches.append(name)
+            else:
+                model = Recipe._meta.get_field(name).related_model
+                prefetches.append(Prefetch(name, queryset=model.objects.only('id')))
+        return prefetches
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
+            return serializers.RecipeImageUploadSerializer
+        elif self.action == 'image_status':
             return serializers.RecipeImageSerializer
+        elif self.action in ('start_image_upload', 'image_upload'):
+            return serializers.ChunkedUploadSerializer
+        elif self.action == 'complete_image_upload':
+            return serializers.ChunkedUploadCompleteSerializer
+        elif self.action == 'match':
+            return serializers.RecipeMatchSerializer
         return self.serializer_class
 
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        response = Response(self.get_serializer(recipe).data)
+        response['Last-Modified'] = http_date(recipe.updated_at.timestamp())
+        links = {
+            name: [(obj.pk, obj.recipe_count) for obj in getattr(recipe, name).all()]
+            for name in recipe_links_shown(request)
+        }
+        response['ETag'] = quote_etag(make_recipe_etag(request, recipe.pk, recipe.updated_at, links))
+        return response
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """create (POST) or update (PATCH) a list of recipes, or delete
+        (DELETE {"ids": [...]}) many at once; invalid items are reported by
+        index without stopping the rest of the batch"""
+        if request.method == 'DELETE':
+            ids = request.data.get('ids') if isinstance(request.data, dict) else None
+            if not isinstance(ids, list) or not all(is_object_id(pk) for pk in ids):
+                raise ValidationError({'ids': 'Expected a list of recipe ids.'})
+            _, deleted = Recipe.objects.filter(user=request.user, id__in=ids).delete()
+            return Response({'deleted': deleted.get(Recipe._meta.label, 0)})
+
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'detail': 'Expected a list of recipes.'})
+        if len(items) > self.bulk_max_items:
+            raise ValidationError({'detail': f'At most {self.bulk_max_items} recipes per request.'})
+
+        if request.method == 'POST':
+            valid, errors = bulk.validate_items(request.user, enumerate(items))
+            recipes = bulk.create_recipes(request.user, [data for _, data in valid])
+        else:
+            ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+            ids = [pk if is_object_id(pk) else None for pk in ids]
+            owned = Recipe.objects.filter(user=request.user).in_bulk([pk for pk in ids if pk])
+            errors = [{'index': index, 'errors': {'id': ['Recipe not found.']}}
+                      for index, pk in enumerate(ids) if pk not in owned]
+            # a recipe is updated once per request; later repeats are errors
+            first = {}
+            for index, pk in enumerate(ids):
+                if pk in owned and first.setdefault(pk, index) != index:
+                    errors.append({'index': index, 'errors': {'id': ['Duplicate id.']}})
+                    ids[index] = None
+            valid, item_errors = bulk.validate_items(
+                request.user,
+                [(index, item) for index, item in enumerate(items) if ids[index] in owned],
+                partial=True
+            )
+            errors = sorted(errors + item_errors, key=lambda error: error['index'])
+            recipes = bulk.update_recipes(
+                request.user, [owned[ids[index]] for index, _ in valid], [data for _, data in valid]
+            )
+
+        fresh = Recipe.objects.prefetch_related('tags', 'ingredients').in_bulk([r.pk for r in recipes])
+        context = self.get_serializer_context()
+        results = [
+            {'index': index, 'recipe': serializers.RecipeSerializer(fresh[recipe.pk], context=context).data}
+            for (index, _), recipe in zip(valid, recipes)
+        ]
+        if not results:
+            return Response({'results': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        success = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+        return Response({'results': results, 'errors': errors}, status=success)
+
+    @action(methods=['GET'], detail=False, url_path='export', url_name='export',
+            renderer_classes=(export.NDJSONRenderer, export.CSVRenderer),
+            content_negotiation_class=export.FallbackNegotiation)
+    def export_library(self, request):
+        """the whole library as ?format=ndjson (default) or csv, streamed
+        so memory stays flat whatever its size"""
+        return export.streaming_response(request.user.pk, request.accepted_renderer)
+
+    @action(methods=['POST'], detail=False, url_path='match')
+    def match(self, request):
+        """recipes using the given ingredients: fully cookable first, then
+        by fewest missing; scored on the user's in-memory pantry matrix"""
+        ser = self.get_serializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        ranked = matching.get_matrix(request.user.pk).match(
+            frozenset(ser.validated_data['ingredients']),
+            ser.validated_data['limit'],
+            ser.validated_data.get('max_missing'),
+        )
+        recipes = Recipe.objects.filter(user=request.user).prefetch_related(
+            *self.get_prefetches()
+        ).in_bulk([pk for pk, _, _ in ranked])
+        context = self.get_serializer_context()
+        results = [
+            {'recipe': serializers.RecipeSerializer(recipes[pk], context=context).data,
+             'matched': matched, 'missing': missing}
+            for pk, matched, missing in ranked if pk in recipes
+        ]
+        return Response({'results': results})
+
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """up to ?k= (default 10) recipes sharing the most tags and
+        ingredients, by MinHash estimated Jaccard similarity"""
+        try:
+            k = max(1, min(int(request.query_params.get('k', self.similar_k)), self.similar_max_k))
+        except ValueError:
+            raise ValidationError({'k': 'Expected an integer.'})
+        ranked = similarity.similar_recipes(self.get_object(), k)
+        recipes = Recipe.objects.filter(user=request.user).prefetch_related(
+            *self.get_prefetches()
+        ).in_bulk([pk for pk, _ in ranked])
+        context = self.get_serializer_context()
+        results = [
+            {'recipe': serializers.RecipeSerializer(recipes[pk], context=context).data, 'similarity': score}
+            for pk, score in ranked if pk in recipes
+        ]
+        return Response({'results': results})
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
+        """stage the upload and return at once; the image worker validates,
+        re-encodes and swaps it in, reported by image-status"""
         recipe = self.get_object()
-        ser = self.get_serializer(recipe, data=request.data)
+        ser = self.get_serializer(data=request.data)
 
         if ser.is_valid():
-            if recipe.image:
-                recipe.image.delete()
-            ser.save()
-            return Response(ser.data, status=status.HTTP_200_OK)
+            images.stage_upload(recipe, ser.validated_data['image'])
+            return Response(
+                serializers.RecipeImageSerializer(recipe, context=self.get_serializer_context()).data,
+                status=status.HTTP_202_ACCEPTED
+            )
 
         return Response(ser.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['GET'], detail=True, url_path='image-status')
+    def image_status(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def get_image_upload(self, upload_id):
+        return get_object_or_404(self.get_object().image_uploads, pk=upload_id)
+
+    @action(methods=['POST'], detail=True, url_path='image-uploads')
+    def start_image_upload(self, request, pk=None):
+        """open a resumable upload of {"size": bytes, "filename": ...}"""
+        recipe = self.get_object()
+        ser = self.get_serializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        upload = uploads.start_upload(recipe, ser.validated_data['size'], ser.validated_data['filename'])
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET', 'PUT'], detail=True, url_path=r'image-uploads/(?P<upload_id>[0-9a-f-]{36})')
+    def image_upload(self, request, pk=None, upload_id=None):
+        """GET reports the offset to resume from; PUT appends the raw chunk
+        described by Content-Range (and optionally Digest: sha-256=...)"""
+        upload = self.get_image_upload(upload_id)
+        if request.method == 'PUT':
+            # checked before a byte of the body is read
+            start, length, digest = uploads.parse_chunk_headers(request.META, upload)
+            upload = uploads.write_chunk(upload, request.stream, start, length, digest)
+        return Response(self.get_serializer(upload).data)
+
+    @action(methods=['POST'], detail=True, url_path=r'image-uploads/(?P<upload_id>[0-9a-f-]{36})/complete')
+    def complete_image_upload(self, request, pk=None, upload_id=None):
+        upload = self.get_image_upload(upload_id)
+        ser = self.get_serializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        uploads.complete_upload(upload, ser.validated_data.get('sha256'))
+        return Response(
+            serializers.RecipeImageSerializer(upload.recipe, context=self.get_serializer_context()).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+def encode_change_cursor(last_id, issued=None):
+    """issued is the moment from which the entries after last_id must still
+    be in the log, now unless given"""
+    issued = int((issued or timezone.now()).timestamp())
+    return base64.urlsafe_b64encode(f'{last_id}:{issued}'.encode()).decode()
+
+
+def decode_change_cursor(cursor):
+    try:
+        last_id, issued = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(last_id), int(issued)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'since': 'Invalid cursor.'})
+
+
+class ChangeFeedView(APIView):
+    """Changes to the user's recipes, tags and ingredients after a cursor.
+
+    Without `since` only a cursor for "now" is returned: take it, download
+    the lists, then poll with it. Cursors older than the change log
+    retention get 410 Gone and the client has to download the lists again.
+    """
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    permission_classes = (IsAuthenticated,)
+    page_size = 500
+    feed = (
+        ('recipe', 'recipes', Recipe, serializers.RecipeSerializer),
+        ('tag', 'tags', Tag, serializers.TagSerializer),
+        ('ingredient', 'ingredients', Ingredient, serializers.IngredientSerializer),
+    )
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'format': self.format_kwarg, 'view': self}
+
+    def get(self, request):
+        entries = ChangeLogEntry.objects.filter(user=request.user)
+        since = request.query_params.get('since')
+        if not since:
+            last_id = entries.order_by('-id').values_list('id', flat=True).first() or 0
+            return Response({'cursor': encode_change_cursor(last_id)})
+
+        last_id, issued = decode_change_cursor(since)
+        retention = timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)
+        if issued < (timezone.now() - retention).timestamp():
+            return Response(
+                {'detail': 'Cursor expired, download the full lists again.'},
+                status=status.HTTP_410_GONE
+            )
+
+        page = list(entries.filter(id__gt=last_id).order_by('id')[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        unread = page[self.page_size] if has_more else None
+        page = page[:self.page_size]
+
+        # only the newest entry per object matters
+        latest = {}
+        for entry in page:
+            latest[entry.model, entry.object_id] = entry.action
+
+        data = {'deleted': {}}
+        for model_name, key, model, serializer_class in self.feed:
+            changed = {pk for (name, pk), action in latest.items()
+                       if name == model_name and action == ChangeLogEntry.UPSERT}
+            deleted = {pk for (name, pk), action in latest.items()
+                       if name == model_name and action == ChangeLogEntry.DELETE}
+            queryset = model.objects.filter(user=request.user, id__in=changed).order_by('id')
+            if model is Recipe:
+                queryset = queryset.prefetch_related('tags', 'ingredients')
+            objs = list(queryset)
+            # upserted then deleted after this page: report it gone now
+            deleted |= changed - {obj.pk for obj in objs}
+            data[key] = serializer_class(objs, many=True, context=self.get_serializer_context()).data
+            data['deleted'][key] = sorted(deleted)
+
+        # while entries are left unread the cursor is only as fresh as the
+        # oldest of them: compaction may drop it before the client is back
+        data['cursor'] = encode_change_cursor(
+            page[-1].id if page else last_id,
+            unread.created_at if unread else None
+        )
+        data['has_more'] = has_more
+        return Response(data)
+
+
+class MediaView(APIView):
+    """recipe images and their variants, served to the owner of a recipe
+    showing them; the transfer is left to the web server when configured"""
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    permission_classes = (IsAuthenticated,)
+    content_negotiation_class = media.IgnoreAcceptNegotiation
+
+    def get(self, request, name):
+        stored = media.resolve(request.user, name)
+        if stored is None or not default_storage.exists(stored):
+            raise Http404
+        return media.serve(request, stored)
+
+
+class RecipeStatsView(APIView):
+    """recipe count, average/min/max price and time_minutes and the number
+    of recipes using each tag and ingredient, read from the user's rollup"""
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response(serializers.RecipeStatsSerializer(stats.get_stats(request.user.pk)).data)
@@ -121,3 +121,59 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'core.User'
+
+# Token authentication cache (user.authentication.CachedTokenAuthentication)
+
+TOKEN_AUTH_CACHE_SIZE = 1024
+TOKEN_AUTH_CACHE_TTL = 60
+# alias from CACHES shared between processes, None keeps it process-local
+TOKEN_AUTH_SHARED_CACHE = None
+
+# Versioned list response cache (recipe.cache.CachedListMixin)
+
+RECIPE_RESPONSE_CACHE = 'default'
+RECIPE_RESPONSE_CACHE_TIMEOUT = 300
+
+# Delta sync change log (core.models.ChangeLogEntry), compacted by
+# `manage.py compact_change_log`
+
+CHANGE_LOG_RETENTION_DAYS = 30
+
+# Recipe image worker (`manage.py process_image_jobs`)
+
+# process uploads right after the request commits instead of queueing them
+RECIPE_IMAGE_EAGER = False
+# seconds a worker holds a job between renewals; jobs whose worker let
+# the lease run out are handed to another one
+RECIPE_IMAGE_JOB_LEASE = 300
+# longest side of the re-encoded image, in pixels
+RECIPE_IMAGE_MAX_SIZE = 2048
+# widths (px) and formats of the responsive variants written next to each
+# image; `manage.py generate_image_variants` backfills existing images
+RECIPE_IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+RECIPE_IMAGE_VARIANT_FORMATS = ('jpeg', 'webp')
+# render variants in the worker; when off they are created on first use
+RECIPE_IMAGE_VARIANTS_EAGER = True
+# largest resumable upload (recipes/<id>/image-uploads/) accepted, in bytes
+RECIPE_IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+
+# Recipe media (recipe.views.MediaView); set one of these to let the web
+# server send the file after the ownership check
+
+# internal nginx location aliasing MEDIA_ROOT, e.g. '/protected-media/'
+RECIPE_MEDIA_X_ACCEL_PREFIX = None
+# Apache mod_xsendfile / lighttpd
+RECIPE_MEDIA_X_SENDFILE = False
+
+# Recipe search (?search= on recipes, recipe.search)
+
+# most ranked matches the in-process index returns for one query
+RECIPE_SEARCH_MAX_RESULTS = 500
+# per-user in-memory indexes kept by each process (recipe.indexes)
+RECIPE_INDEX_CACHE_SIZE = 256
+
+# Recipe export (recipes/export/?format=ndjson|csv)
+
+# recipes read per server-side cursor fetch, with their tag and ingredient
+# names looked up one query per chunk
+RECIPE_EXPORT_CHUNK_SIZE = 2000
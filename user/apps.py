@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        # connects the token cache invalidation receivers
+        from user import authentication  # noqa: F401
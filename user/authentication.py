@@ -0,0 +1,189 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+SHARED_KEY_PREFIX = 'auth-token:'
+USER_VERSION_PREFIX = 'auth-user-version:'
+
+
+class TokenCache:
+    """process-local LRU of token key -> (Token with its user, version of
+    the user's shared auth entry), bounded in size and expiring entries
+    after ttl seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, token, version = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token, version
+
+    def set(self, key, token, version=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            stale = [key for key, (_, token, _) in self._entries.items() if token.user_id == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+local_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60),
+)
+
+
+def get_shared_cache():
+    """optional second tier shared between processes, e.g. memcached or redis"""
+    alias = getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _user_version_seed():
+    # clock based, so a version lost to eviction is never handed out again
+    return int(time.time() * 1000000)
+
+
+def get_user_version(shared, user_id):
+    """version of the user's auth entries in the shared tier, moved by every
+    eviction so that other processes drop their local copies"""
+    key = USER_VERSION_PREFIX + str(user_id)
+    version = shared.get(key)
+    if version is None:
+        shared.add(key, _user_version_seed(), None)
+        version = shared.get(key)
+    return version
+
+
+def bump_user_version(shared, user_id):
+    key = USER_VERSION_PREFIX + str(user_id)
+    try:
+        shared.incr(key)
+    except ValueError:
+        shared.add(key, _user_version_seed(), None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication answering repeated tokens without the Token + User query.
+
+    Entries are dropped when their token is deleted or their user is saved
+    (e.g. deactivated). With a shared tier configured, that also moves a
+    per-user version in it, which every local hit checks (one cache read
+    instead of two queries), so other processes stop accepting the token
+    at once. Without one, other processes only notice once their local
+    entry expires. Writes that send no post_save, like
+    QuerySet.update(is_active=False), have to call evict_user() for the
+    users they touch, or those keep authenticating until the TTL.
+
+    Every request gets its own copy of the cached token and user, so a view
+    changing request.user (e.g. set_password) never touches what other
+    requests are handed.
+    """
+    counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+    _counters_lock = threading.Lock()
+
+    @classmethod
+    def _count(cls, name):
+        with cls._counters_lock:
+            cls.counters[name] += 1
+
+    @classmethod
+    def stats(cls):
+        with cls._counters_lock:
+            return dict(cls.counters, size=len(local_cache))
+
+    def authenticate_credentials(self, key):
+        shared = get_shared_cache()
+        entry = local_cache.get(key)
+        if entry is not None:
+            token, version = entry
+            if shared is None or get_user_version(shared, token.user_id) == version:
+                self._count('local_hits')
+                token = copy.deepcopy(token)
+                return token.user, token
+            local_cache.delete(key)
+
+        if shared is not None:
+            entry = shared.get(SHARED_KEY_PREFIX + key)
+            if entry is not None:
+                token, version = entry
+                if get_user_version(shared, token.user_id) == version:
+                    self._count('shared_hits')
+                    local_cache.set(key, copy.deepcopy(token), version)
+                    return token.user, token
+
+        self._count('misses')
+        user, token = super().authenticate_credentials(key)
+        version = None
+        if shared is not None:
+            version = get_user_version(shared, user.pk)
+            shared.set(SHARED_KEY_PREFIX + key, (token, version), local_cache.ttl)
+        local_cache.set(key, copy.deepcopy(token), version)
+        return user, token
+
+
+def _bump_user_version_on_commit(shared, user_id):
+    # again once committed: another process reading the old rows in
+    # between may have cached them under the first bump
+    bump_user_version(shared, user_id)
+    transaction.on_commit(lambda: bump_user_version(shared, user_id))
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    local_cache.delete(instance.key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(SHARED_KEY_PREFIX + instance.key)
+        _bump_user_version_on_commit(shared, instance.user_id)
+
+
+def evict_user(user_id):
+    """drop the cached tokens of a user, for changes made without post_save"""
+    local_cache.delete_user(user_id)
+    shared = get_shared_cache()
+    if shared is not None:
+        _bump_user_version_on_commit(shared, user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_saved_user(sender, instance, created, **kwargs):
+    if not created:
+        evict_user(instance.pk)
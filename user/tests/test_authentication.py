@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.tests.utils import QueryBudgetMixin
+from user.authentication import CachedTokenAuthentication, evict_user, local_cache
+
+PROFILE_URL = reverse('user:profile')
+
+
+class CachedTokenAuthenticationTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        local_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='test123',
+            name='test user'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_token_served_from_cache(self):
+        before = CachedTokenAuthentication.stats()
+        self.client.get(PROFILE_URL)
+
+        with self.assertMaxQueries(0):
+            res = self.client.get(PROFILE_URL)
+
+        after = CachedTokenAuthentication.stats()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['local_hits'] - before['local_hits'], 1)
+
+    def test_deleted_token_invalidated(self):
+        self.client.get(PROFILE_URL)
+        self.token.delete()
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        self.client.get(PROFILE_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_request_gets_its_own_user(self):
+        auth = CachedTokenAuthentication()
+        first, _ = auth.authenticate_credentials(self.token.key)
+        first.name = 'changed in place'
+        second, _ = auth.authenticate_credentials(self.token.key)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.name, 'test user')
+
+    def test_user_updated_without_save_evicted(self):
+        self.client.get(PROFILE_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        evict_user(self.user.pk)
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_bounded(self):
+        local_cache.clear()
+        for i in range(local_cache.max_size + 5):
+            local_cache.set(f'key-{i}', self.token)
+
+        self.assertEqual(len(local_cache), local_cache.max_size)
+        self.assertIsNone(local_cache.get('key-0'))
+
+
+@override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+class SharedTokenCacheTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        local_cache.clear()
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            email='shared@gmail.com',
+            password='test123',
+            name='test user'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def revoked_in_other_process(self, revoke):
+        """run revoke as another process would: its receivers reach the
+        shared tier, but this process keeps its local entry"""
+        self.client.get(PROFILE_URL)
+        entry = local_cache.get(self.token.key)
+        revoke()
+        local_cache.set(self.token.key, *entry)
+
+    def test_local_hit_checks_shared_version(self):
+        self.client.get(PROFILE_URL)
+
+        with self.assertMaxQueries(0):
+            res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_user_deactivated_in_other_process(self):
+        def revoke():
+            self.user.is_active = False
+            self.user.save()
+        self.revoked_in_other_process(revoke)
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_deleted_in_other_process(self):
+        self.revoked_in_other_process(self.token.delete)
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
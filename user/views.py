@@ -3,6 +3,7 @@ from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
 from user import serializers
+from user.authentication import CachedTokenAuthentication
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -15,7 +16,7 @@ class CreateTokenView(ObtainAuthToken):
 
 
 class ManageUserApiView(generics.RetrieveUpdateAPIView):
-    authentication_classes = (authentication.TokenAuthentication,
+    authentication_classes = (CachedTokenAuthentication,
                               authentication.SessionAuthentication)
     permission_classes = (permissions.IsAuthenticated, )
     serializer_class = serializers.UserSerializer